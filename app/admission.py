@@ -0,0 +1,167 @@
+from __future__ import annotations
+
+import asyncio
+import math
+import os
+from typing import Dict, Optional, Tuple
+
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+
+# Per-route-class admission control.
+# Long media streams and blocking Telegram calls each hold a threadpool slot
+# for as long as the upstream takes; without a cap they can take all of
+# anyio's 40 threads and stall cheap DB reads and /static. Every class gets a
+# concurrency limit and a bounded wait queue. A request that finds the queue
+# full, or waits longer than the class allows, gets an immediate 503 with
+# Retry-After instead of piling up. Limits are per worker process.
+#
+# APP_ADMISSION_<CLASS>="limit,queue,wait_seconds" overrides the defaults
+# below; APP_ADMISSION=0 turns the middleware off.
+
+ENABLED = os.getenv("APP_ADMISSION", "1") == "1"
+
+# class -> (concurrent requests, waiting requests, max wait in seconds).
+# media + telegram + admin stay well below the 40 threadpool slots, so DB
+# reads always have threads left.
+DEFAULT_LIMITS: Dict[str, Tuple[int, int, float]] = {
+    "media": (12, 24, 2.0),
+    "telegram": (6, 12, 5.0),
+    "admin": (4, 8, 5.0),
+    "db": (32, 128, 1.0),
+}
+
+# Telegram-backed routes outside /media
+TELEGRAM_ROUTES = {("POST", "/send"), ("POST", "/admin/telegram/fetch")}
+# Never limited: static files are cheap, SSE streams do not use the threadpool,
+# and the stats endpoint must answer while a class is saturated
+EXEMPT_PREFIXES = ("/static/", "/events/", "/admin/admission")
+
+
+def classify(method: str, path: str) -> Optional[str]:
+    if path.startswith(EXEMPT_PREFIXES):
+        return None
+    if path.startswith("/media/"):
+        return "media"
+    if (method, path) in TELEGRAM_ROUTES:
+        return "telegram"
+    if path.startswith("/admin"):
+        return "admin"
+    return "db"
+
+
+def _limits_from_env(name: str, default: Tuple[int, int, float]) -> Tuple[int, int, float]:
+    raw = os.getenv(f"APP_ADMISSION_{name.upper()}")
+    if not raw:
+        return default
+    limit, queue, wait = (raw.split(",") + ["", "", ""])[:3]
+    return (
+        int(limit) if limit else default[0],
+        int(queue) if queue else default[1],
+        float(wait) if wait else default[2],
+    )
+
+
+class RouteClass:
+    def __init__(self, name: str, limit: int, queue: int, wait: float) -> None:
+        self.name = name
+        self.limit = limit
+        self.queue = queue
+        self.wait = wait
+        self.retry_after = str(max(1, math.ceil(wait)))
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = {"queue_full": 0, "timeout": 0}
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    async def acquire(self) -> Optional[str]:
+        """None once admitted, otherwise the reason for rejecting the request."""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.limit)
+        if self._semaphore.locked():
+            if self.waiting >= self.queue:
+                self.rejected["queue_full"] += 1
+                return "queue_full"
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.wait)
+            except asyncio.TimeoutError:
+                self.rejected["timeout"] += 1
+                return "timeout"
+            finally:
+                self.waiting -= 1
+        else:
+            await self._semaphore.acquire()
+        self.active += 1
+        self.admitted += 1
+        return None
+
+    def release(self) -> None:
+        self.active -= 1
+        self._semaphore.release()
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "limit": self.limit,
+            "queue": self.queue,
+            "wait": self.wait,
+            "active": self.active,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+        }
+
+
+class AdmissionController:
+    def __init__(self, limits: Dict[str, Tuple[int, int, float]]) -> None:
+        self.classes = {name: RouteClass(name, *values) for name, values in limits.items()}
+
+    @classmethod
+    def from_env(cls) -> "AdmissionController":
+        return cls({name: _limits_from_env(name, default) for name, default in DEFAULT_LIMITS.items()})
+
+    def stats(self) -> Dict[str, object]:
+        classes = {name: rc.stats() for name, rc in self.classes.items()}
+        # The class rejecting the most requests is the bottleneck
+        worst = max(self.classes.values(), key=lambda rc: sum(rc.rejected.values()))
+        return {
+            "pid": os.getpid(),
+            "enabled": ENABLED,
+            "bottleneck": worst.name if sum(worst.rejected.values()) else None,
+            "classes": classes,
+        }
+
+
+controller = AdmissionController.from_env()
+
+
+class AdmissionMiddleware:
+    def __init__(self, app: ASGIApp, controller: AdmissionController = controller) -> None:
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if not ENABLED or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        route_class = self.controller.classes.get(classify(scope["method"], scope["path"]))
+        if route_class is None:
+            await self.app(scope, receive, send)
+            return
+
+        reason = await route_class.acquire()
+        if reason is not None:
+            response = JSONResponse(
+                {"detail": f"Server busy ({route_class.name}), retry later"},
+                status_code=503,
+                headers={"Retry-After": route_class.retry_after, "X-Admission-Class": route_class.name},
+            )
+            await response(scope, receive, send)
+            return
+        try:
+            # Held until the last body chunk is sent, so streams count in full
+            await self.app(scope, receive, send)
+        finally:
+            route_class.release()
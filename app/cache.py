@@ -0,0 +1,411 @@
+from __future__ import annotations
+
+import os
+import secrets
+import socket
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple, Union
+from urllib.parse import urlparse
+
+
+# Pluggable cache shared by all uvicorn workers.
+#
+# APP_CACHE_URL selects the backend:
+#   sqlite:///path/to/cache.db  (default, under APP_DATA_DIR) - shared by processes on one host
+#   redis://host:6379/0         - any Redis-protocol server (Redis, KeyDB, a local stand-in)
+#   memory://                   - per-process, for single-worker runs
+#
+# Invalidation is done with counters (incr) that are embedded in cache keys, so
+# one increment is seen by every worker. Kept free of SQLAlchemy so the media
+# edge can use it.
+
+DATA_DIR = os.getenv("APP_DATA_DIR", "/workspace/data")
+CACHE_URL = os.getenv("APP_CACHE_URL", f"sqlite:///{os.path.join(DATA_DIR, 'cache.db')}")
+
+Value = Union[bytes, str]
+
+
+def _to_bytes(value: Value) -> bytes:
+    return value.encode("utf-8") if isinstance(value, str) else value
+
+
+class CacheBackend:
+    def get(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Value, ttl: Optional[float] = None) -> None:
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def add(self, key: str, value: Value) -> bool:
+        """Set ``key`` only if it does not exist; True if this call set it."""
+        raise NotImplementedError
+
+    def incr(self, key: str, amount: int = 1) -> int:
+        """Atomically add ``amount`` to an integer counter and return the new value."""
+        raise NotImplementedError
+
+
+class MemoryCache(CacheBackend):
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._data: Dict[str, tuple] = {}
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at is not None and expires_at < time.time():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key: str, value: Value, ttl: Optional[float] = None) -> None:
+        with self._lock:
+            self._data[key] = (_to_bytes(value), time.time() + ttl if ttl else None)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def add(self, key: str, value: Value) -> bool:
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and (item[1] is None or item[1] >= time.time()):
+                return False
+            self._data[key] = (_to_bytes(value), None)
+            return True
+
+    def incr(self, key: str, amount: int = 1) -> int:
+        with self._lock:
+            value, expires_at = self._data.get(key, (b"0", None))
+            value = str(int(value) + amount).encode()
+            self._data[key] = (value, expires_at)
+            return int(value)
+
+
+class SQLiteCache(CacheBackend):
+    PURGE_EVERY = 500
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._local = threading.local()
+        self._sets = 0
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB, expires_at REAL)")
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # autocommit; every statement is its own short transaction
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[bytes]:
+        row = self._conn().execute(
+            "SELECT value FROM cache WHERE key = ? AND (expires_at IS NULL OR expires_at >= ?)", (key, time.time())
+        ).fetchone()
+        if row is None:
+            return None
+        value = row[0]
+        return str(value).encode() if isinstance(value, int) else value
+
+    def set(self, key: str, value: Value, ttl: Optional[float] = None) -> None:
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, _to_bytes(value), time.time() + ttl if ttl else None),
+        )
+        self._sets += 1
+        if self._sets % self.PURGE_EVERY == 0:
+            conn.execute("DELETE FROM cache WHERE expires_at < ?", (time.time(),))
+
+    def delete(self, key: str) -> None:
+        self._conn().execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def add(self, key: str, value: Value) -> bool:
+        now = time.time()
+        cur = self._conn().execute(
+            "INSERT INTO cache (key, value, expires_at) VALUES (?, ?, NULL)"
+            " ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = NULL"
+            " WHERE expires_at IS NOT NULL AND expires_at < ?",
+            (key, _to_bytes(value), now),
+        )
+        return cur.rowcount == 1
+
+    def incr(self, key: str, amount: int = 1) -> int:
+        row = self._conn().execute(
+            "INSERT INTO cache (key, value, expires_at) VALUES (?, ?, NULL)"
+            " ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + excluded.value"
+            " RETURNING value",
+            (key, amount),
+        ).fetchone()
+        return int(row[0])
+
+
+class RedisError(Exception):
+    pass
+
+
+class RedisCache(CacheBackend):
+    """Minimal RESP2 client: one connection per thread, reconnects once on failure."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 6379, db: int = 0, password: Optional[str] = None, timeout: float = 2.0) -> None:
+        self.host, self.port, self.db, self.password, self.timeout = host, port, db, password, timeout
+        self._local = threading.local()
+
+    @classmethod
+    def from_url(cls, url: str) -> "RedisCache":
+        parsed = urlparse(url)
+        db = int(parsed.path.lstrip("/") or 0)
+        return cls(parsed.hostname or "127.0.0.1", parsed.port or 6379, db, parsed.password)
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        stream = sock.makefile("rwb")
+        self._local.stream = stream
+        if self.password:
+            self._roundtrip("AUTH", self.password)
+        if self.db:
+            self._roundtrip("SELECT", str(self.db))
+        return stream
+
+    def _roundtrip(self, *args: Value):
+        stream = self._local.stream
+        parts: List[bytes] = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            data = _to_bytes(arg)
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        stream.write(b"".join(parts))
+        stream.flush()
+        return self._read(stream)
+
+    def _read(self, stream):
+        line = stream.readline()
+        if not line:
+            raise ConnectionError("connection closed")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest
+        if kind == b"-":
+            raise RedisError(rest.decode())
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            length = int(rest)
+            if length < 0:
+                return None
+            data = stream.read(length + 2)
+            return data[:-2]
+        if kind == b"*":
+            count = int(rest)
+            return None if count < 0 else [self._read(stream) for _ in range(count)]
+        raise RedisError(f"unexpected reply: {line!r}")
+
+    def _command(self, *args: Value):
+        for attempt in (0, 1):
+            try:
+                if getattr(self._local, "stream", None) is None:
+                    self._connect()
+                return self._roundtrip(*args)
+            except (OSError, ConnectionError):
+                self._local.stream = None
+                if attempt:
+                    raise
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self._command("GET", key)
+
+    def set(self, key: str, value: Value, ttl: Optional[float] = None) -> None:
+        if ttl:
+            self._command("SET", key, value, "PX", str(int(ttl * 1000)))
+        else:
+            self._command("SET", key, value)
+
+    def delete(self, key: str) -> None:
+        self._command("DEL", key)
+
+    def add(self, key: str, value: Value) -> bool:
+        return self._command("SET", key, value, "NX") is not None
+
+    def incr(self, key: str, amount: int = 1) -> int:
+        return int(self._command("INCRBY", key, str(amount)))
+
+
+def from_url(url: str) -> CacheBackend:
+    scheme = urlparse(url).scheme
+    if scheme == "memory":
+        return MemoryCache()
+    if scheme == "sqlite":
+        path = url[len("sqlite:///"):]
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        return SQLiteCache(path)
+    if scheme in ("redis", "tcp"):
+        return RedisCache.from_url(url)
+    raise ValueError(f"Unsupported APP_CACHE_URL: {url}")
+
+
+class SharedCache:
+    """Front for the configured backend.
+
+    Failures of the backend are treated as misses so a cache outage never
+    breaks a request. Hit/miss counts are flushed to shared counters in
+    batches, so every worker reports the same hit ratio.
+    """
+
+    STATS_FLUSH_EVERY = 50
+
+    def __init__(self, backend: CacheBackend) -> None:
+        self.backend = backend
+        self._lock = threading.Lock()
+        self._pending = {"hits": 0, "misses": 0}
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._pending[name] += 1
+            if sum(self._pending.values()) < self.STATS_FLUSH_EVERY:
+                return
+            pending, self._pending = self._pending, {"hits": 0, "misses": 0}
+        self._flush(pending)
+
+    def _flush(self, pending: Dict[str, int]) -> None:
+        for name, amount in pending.items():
+            if amount:
+                try:
+                    self.backend.incr(f"stats:{name}", amount)
+                except Exception:
+                    pass
+
+    def get(self, key: str) -> Optional[bytes]:
+        try:
+            value = self.backend.get(key)
+        except Exception:
+            value = None
+        self._count("hits" if value is not None else "misses")
+        return value
+
+    def set(self, key: str, value: Value, ttl: Optional[float] = None) -> None:
+        try:
+            self.backend.set(key, value, ttl)
+        except Exception:
+            pass
+
+    def delete(self, key: str) -> None:
+        try:
+            self.backend.delete(key)
+        except Exception:
+            pass
+
+    def incr(self, key: str, amount: int = 1) -> Optional[int]:
+        try:
+            return self.backend.incr(key, amount)
+        except Exception:
+            return None
+
+    def counter(self, key: str) -> int:
+        """Current value of an incr() counter; read-only and not counted in stats."""
+        try:
+            value = self.backend.get(key)
+        except Exception:
+            return 0
+        return int(value) if value else 0
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            pending, self._pending = self._pending, {"hits": 0, "misses": 0}
+        self._flush(pending)
+        hits = self.counter("stats:hits")
+        misses = self.counter("stats:misses")
+        total = hits + misses
+        return {
+            "backend": type(self.backend).__name__,
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": round(hits / total, 4) if total else None,
+        }
+
+
+_cache: Optional[SharedCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> SharedCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = SharedCache(from_url(CACHE_URL))
+    return _cache
+
+
+# Invalidation counters
+
+CATALOG_VERSION_KEY = "catalog:version"
+# Unix time of the last bump, for Last-Modified
+CATALOG_MODIFIED_KEY = "catalog:modified"
+# Random prefix of every catalog version. The counter restarts at 0 whenever
+# the backend loses its data (memory:// restart, Redis restart or FLUSHALL,
+# cache.db deleted), and a lost bump leaves it behind the content; a new
+# epoch makes every ETag and fragment key handed out before stop matching.
+CATALOG_EPOCH_KEY = "catalog:epoch"
+
+# Set when a bump could not reach the backend; the epoch is dropped as soon
+# as it is reachable again
+_bump_lost = threading.Event()
+
+
+def catalog_version() -> Optional[str]:
+    state = catalog_state()
+    return state[0] if state else None
+
+
+def catalog_state() -> Optional[Tuple[str, float]]:
+    """(version, last modified) of the catalog, as seen by every worker.
+
+    None while the backend is unreachable: no version can be trusted then.
+    """
+    backend = get_cache().backend
+    try:
+        if _bump_lost.is_set():
+            backend.delete(CATALOG_EPOCH_KEY)
+            _bump_lost.clear()
+        epoch = backend.get(CATALOG_EPOCH_KEY)
+        if epoch is None:
+            # First worker to get here picks the epoch, the others read it
+            backend.add(CATALOG_EPOCH_KEY, secrets.token_hex(4))
+            epoch = backend.get(CATALOG_EPOCH_KEY)
+            # Content may have changed while the data was gone, which only
+            # ever makes clients refetch
+            backend.set(CATALOG_MODIFIED_KEY, str(time.time()))
+        version = backend.get(CATALOG_VERSION_KEY)
+        modified = backend.get(CATALOG_MODIFIED_KEY)
+        if modified is None:
+            modified = str(time.time())
+            backend.set(CATALOG_MODIFIED_KEY, modified)
+        return f"{epoch.decode()}.{int(version or 0)}", float(modified)
+    except Exception:
+        return None
+
+
+def bump_catalog_version() -> Optional[int]:
+    cache = get_cache()
+    version = cache.incr(CATALOG_VERSION_KEY)
+    if version is None:
+        _bump_lost.set()
+        try:
+            cache.backend.delete(CATALOG_EPOCH_KEY)
+            _bump_lost.clear()
+        except Exception:
+            pass
+    cache.set(CATALOG_MODIFIED_KEY, str(time.time()))
+    return version
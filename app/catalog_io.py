@@ -0,0 +1,208 @@
+from __future__ import annotations
+
+import codecs
+import csv
+import datetime as dt
+import io
+import json
+from dataclasses import dataclass, field
+from typing import IO, Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from sqlalchemy import bindparam, insert, select, update
+from sqlalchemy.orm import Session
+
+from .database import Gift
+
+
+# Streaming bulk import/export of gifts as NDJSON or CSV.
+# Import reads the upload line by line and writes in batched transactions,
+# upserting on telegram_file_id; export walks a yield_per cursor.
+
+FORMATS = ("ndjson", "csv")
+FIELDS = ("title", "description", "gif_url", "telegram_file_id")
+EXPORT_FIELDS = ("id",) + FIELDS + ("created_at", "updated_at")
+BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 100
+
+
+def detect_format(filename: Optional[str], explicit: Optional[str] = None) -> Optional[str]:
+    if explicit:
+        return explicit if explicit in FORMATS else None
+    name = (filename or "").lower()
+    if name.endswith(".csv"):
+        return "csv"
+    if name.endswith((".ndjson", ".jsonl", ".json")):
+        return "ndjson"
+    return None
+
+
+@dataclass
+class ImportReport:
+    inserted: int = 0
+    updated: int = 0
+    skipped: int = 0
+    errors: List[Dict[str, Any]] = field(default_factory=list)
+
+    def error(self, line: int, message: str) -> None:
+        self.skipped += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "error": message})
+
+
+def _clean(raw: Dict[str, Any]) -> Dict[str, Optional[str]]:
+    row: Dict[str, Optional[str]] = {}
+    for name in FIELDS:
+        value = raw.get(name)
+        value = str(value).strip() if value is not None else ""
+        row[name] = value or None
+    return row
+
+
+def _decode_lines(fileobj: IO[bytes], bad_lines: Set[int]) -> Iterator[str]:
+    """Decode the upload line by line, so one bad byte only costs its line.
+
+    Lines that are not UTF-8 are decoded with replacement characters and
+    their numbers added to ``bad_lines``.
+    """
+    for lineno, raw in enumerate(fileobj, start=1):
+        if lineno == 1 and raw.startswith(codecs.BOM_UTF8):
+            raw = raw[len(codecs.BOM_UTF8):]
+        try:
+            yield raw.decode("utf-8")
+        except UnicodeDecodeError:
+            bad_lines.add(lineno)
+            yield raw.decode("utf-8", errors="replace")
+
+
+# Parsers yield (first line, last line, record) of every record
+
+def _parse_ndjson(lines: Iterable[str]) -> Iterator[Tuple[int, int, Any]]:
+    for lineno, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield lineno, lineno, json.loads(line)
+        except ValueError as e:
+            yield lineno, lineno, e
+
+
+def _parse_csv(lines: Iterable[str]) -> Iterator[Tuple[int, int, Any]]:
+    reader = csv.DictReader(lines)
+    last = 1  # the header
+    for record in reader:
+        yield last + 1, reader.line_num, record
+        last = reader.line_num
+
+
+def iter_rows(fileobj: IO[bytes], fmt: str, report: ImportReport) -> Iterator[Dict[str, Optional[str]]]:
+    bad_lines: Set[int] = set()
+    parse = _parse_csv if fmt == "csv" else _parse_ndjson
+    for first, lineno, record in parse(_decode_lines(fileobj, bad_lines)):
+        if bad_lines and any(n in bad_lines for n in range(first, lineno + 1)):
+            report.error(lineno, "Invalid UTF-8")
+            continue
+        if isinstance(record, Exception):
+            report.error(lineno, f"Invalid JSON: {record}")
+            continue
+        if not isinstance(record, dict):
+            report.error(lineno, "Expected an object")
+            continue
+        row = _clean(record)
+        if not row["title"]:
+            report.error(lineno, "Missing title")
+            continue
+        row["title"] = row["title"][:200]
+        yield row
+
+
+def _batches(rows: Iterable[Dict[str, Optional[str]]], size: int) -> Iterator[List[Dict[str, Optional[str]]]]:
+    batch: List[Dict[str, Optional[str]]] = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _upsert_batch(db: Session, batch: List[Dict[str, Optional[str]]], report: ImportReport) -> None:
+    keyed: Dict[str, Dict[str, Optional[str]]] = {}
+    plain: List[Dict[str, Optional[str]]] = []
+    superseded = 0
+    for row in batch:
+        if row["telegram_file_id"]:
+            # Last occurrence of a key within the batch wins; the earlier one
+            # counts as updated, as it would if they were in separate batches
+            if row["telegram_file_id"] in keyed:
+                superseded += 1
+            keyed[row["telegram_file_id"]] = row
+        else:
+            plain.append(row)
+
+    existing = set()
+    if keyed:
+        existing = set(
+            db.execute(select(Gift.telegram_file_id).where(Gift.telegram_file_id.in_(list(keyed))).distinct()).scalars()
+        )
+    now = dt.datetime.utcnow()
+    to_update = [dict(row, key=key, updated_at=now) for key, row in keyed.items() if key in existing]
+    to_insert = plain + [row for key, row in keyed.items() if key not in existing]
+
+    if to_update:
+        table = Gift.__table__
+        stmt = (
+            update(table)
+            .where(table.c.telegram_file_id == bindparam("key"))
+            .values(
+                title=bindparam("title"),
+                description=bindparam("description"),
+                gif_url=bindparam("gif_url"),
+                updated_at=bindparam("updated_at"),
+            )
+        )
+        db.execute(stmt, to_update)
+    if to_insert:
+        db.execute(insert(Gift), [dict(row, created_at=now, updated_at=now) for row in to_insert])
+    db.commit()
+    report.updated += len(to_update) + superseded
+    report.inserted += len(to_insert)
+
+
+def import_gifts(db: Session, fileobj: IO[bytes], fmt: str, batch_size: int = BATCH_SIZE) -> ImportReport:
+    report = ImportReport()
+    for batch in _batches(iter_rows(fileobj, fmt, report), batch_size):
+        _upsert_batch(db, batch, report)
+    return report
+
+
+def _export_value(value: Any) -> Any:
+    if isinstance(value, dt.datetime):
+        return value.isoformat()
+    return value
+
+
+def export_gifts(db: Session, fmt: str, yield_per: int = BATCH_SIZE, chunk_size: int = 64 * 1024) -> Iterator[str]:
+    """Yield the gift table as NDJSON or CSV text chunks; closes ``db`` when done."""
+    columns = [getattr(Gift, name) for name in EXPORT_FIELDS]
+    stmt = select(*columns).order_by(Gift.id).execution_options(yield_per=yield_per)
+    buf = io.StringIO()
+    writer = csv.writer(buf) if fmt == "csv" else None
+    try:
+        if writer:
+            writer.writerow(EXPORT_FIELDS)
+        for row in db.execute(stmt):
+            values = [_export_value(v) for v in row]
+            if writer:
+                writer.writerow(values)
+            else:
+                buf.write(json.dumps(dict(zip(EXPORT_FIELDS, values)), ensure_ascii=False))
+                buf.write("\n")
+            if buf.tell() >= chunk_size:
+                yield buf.getvalue()
+                buf.seek(0)
+                buf.truncate()
+        if buf.tell():
+            yield buf.getvalue()
+    finally:
+        db.close()
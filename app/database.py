@@ -4,11 +4,15 @@ import os
 import datetime as dt
 from typing import Optional
 
-from sqlalchemy import Column, Integer, String, Text, DateTime, create_engine, UniqueConstraint
+from sqlalchemy import Column, Float, Index, Integer, String, Text, DateTime, create_engine, event, inspect, text, UniqueConstraint
 from sqlalchemy.orm import declarative_base, sessionmaker
 
+from .cache import bump_catalog_version
+from .search import init_search
+
 
 DATA_DIR = os.getenv("APP_DATA_DIR", "/workspace/data")
+RENDITIONS_DIR = os.path.join(DATA_DIR, "renditions")
 DB_URL = os.getenv("APP_DATABASE_URL", f"sqlite:///{os.path.join(DATA_DIR, 'app.db')}")
 
 os.makedirs(DATA_DIR, exist_ok=True)
@@ -17,24 +21,69 @@ engine = create_engine(DB_URL, connect_args={"check_same_thread": False} if DB_U
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True)
 Base = declarative_base()
 
+# How long a writer waits for another writer's lock before "database is locked"
+BUSY_TIMEOUT_MS = 15000
+
+
+if engine.dialect.name == "sqlite":
+
+    # WAL: readers never block writers, so a streamed page or export holding
+    # a yield_per cursor open for a slow client does not lock out admin
+    # writes, imports and the ingest journal
+    @event.listens_for(engine, "connect")
+    def _sqlite_pragmas(dbapi_conn, connection_record) -> None:
+        cursor = dbapi_conn.cursor()
+        # Only takes effect on a new database, and only before the switch to
+        # WAL writes its first page; lets app.reconcile give free pages back
+        # in small steps instead of a full VACUUM
+        cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.close()
+
 
 class Gift(Base):
     __tablename__ = "gifts"
 
     id = Column(Integer, primary_key=True, index=True)
-    title = Column(String(200), nullable=False)
+    title = Column(String(200), nullable=False, index=True)
     description = Column(Text, nullable=True)
     gif_url = Column(String(1024), nullable=True)
     telegram_file_id = Column(String(256), nullable=True, index=True)
-    created_at = Column(DateTime, nullable=False, default=dt.datetime.utcnow)
+    created_at = Column(DateTime, nullable=False, default=dt.datetime.utcnow, index=True)
+    updated_at = Column(DateTime, nullable=False, default=dt.datetime.utcnow, onupdate=dt.datetime.utcnow, index=True)
+
+
+# Change logs for delta sync, written only by the triggers in _CHANGE_LOG_DDL:
+# one row per gift / media id, moved to a fresh seq on every insert, update or
+# delete. AUTOINCREMENT so a seq is never handed out twice, even after the
+# newest row is replaced; it is assigned inside the writing transaction, and
+# SQLite has a single writer, so seqs become visible in commit order.
+class GiftChange(Base):
+    __tablename__ = "gift_changes"
+    __table_args__ = {"sqlite_autoincrement": True}
+    seq = Column(Integer, primary_key=True)
+    gift_id = Column(Integer, nullable=False, unique=True)
+    deleted = Column(Integer, nullable=False, default=0)
+
+
+class MediaChange(Base):
+    __tablename__ = "media_changes"
+    __table_args__ = {"sqlite_autoincrement": True}
+    seq = Column(Integer, primary_key=True)
+    media_id = Column(Integer, nullable=False, unique=True)
+    deleted = Column(Integer, nullable=False, default=0)
 
 
 class TelegramMedia(Base):
     __tablename__ = "telegram_media"
     id = Column(Integer, primary_key=True)
     file_id = Column(String(256), nullable=False, index=True)
-    file_unique_id = Column(String(256), nullable=True)
+    file_unique_id = Column(String(256), nullable=True, index=True)
     file_path = Column(String(512), nullable=True)
+    # Last time app.reconcile asked Telegram whether file_path is still valid
+    file_path_checked_at = Column(DateTime, nullable=True, index=True)
     mime_type = Column(String(128), nullable=True)
     width = Column(Integer, nullable=True)
     height = Column(Integer, nullable=True)
@@ -47,11 +96,227 @@ class TelegramMedia(Base):
     )
 
 
+# Size-optimized copies of Telegram animations, produced by app.transcode
+class MediaRendition(Base):
+    __tablename__ = "media_renditions"
+    id = Column(Integer, primary_key=True)
+    file_unique_id = Column(String(256), nullable=False, index=True)
+    label = Column(String(32), nullable=False)
+    # Relative to RENDITIONS_DIR; NULL when the rendition would not save bytes
+    path = Column(String(512), nullable=True)
+    codec = Column(String(32), nullable=True)
+    mime_type = Column(String(128), nullable=True)
+    bytes = Column(Integer, nullable=True)
+    width = Column(Integer, nullable=True)
+    height = Column(Integer, nullable=True)
+    duration = Column(Float, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=dt.datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint("file_unique_id", "label", name="uq_media_renditions_label"),
+    )
+
+
+# Probed facts about original Telegram files, filled in by app.probe
+class MediaMetadata(Base):
+    __tablename__ = "media_metadata"
+    id = Column(Integer, primary_key=True)
+    file_unique_id = Column(String(256), nullable=False, unique=True, index=True)
+    mime_type = Column(String(128), nullable=True)
+    bytes = Column(Integer, nullable=True)
+    width = Column(Integer, nullable=True)
+    height = Column(Integer, nullable=True)
+    duration = Column(Float, nullable=True)
+    sha256 = Column(String(64), nullable=True, index=True)
+    probed_at = Column(DateTime, nullable=False, default=dt.datetime.utcnow)
+
+
 class TelegramState(Base):
     __tablename__ = "telegram_state"
     id = Column(Integer, primary_key=True, default=1)
     last_update_id = Column(Integer, nullable=True)
 
 
+# Durable journal of raw getUpdates results, drained by app.ingest. Rows are
+# written in the same transaction that advances telegram_state, so an update
+# is never acknowledged to Telegram before it is stored.
+class TelegramUpdate(Base):
+    __tablename__ = "telegram_updates"
+    update_id = Column(Integer, primary_key=True, autoincrement=False)
+    payload = Column(Text, nullable=False)
+    # pending -> processing -> done | failed
+    status = Column(String(16), nullable=False, default="pending")
+    attempts = Column(Integer, nullable=False, default=0)
+    # Earliest time a consumer may claim the row: retry backoff, or the end of
+    # the lease of the consumer processing it
+    available_at = Column(DateTime, nullable=False, default=dt.datetime.utcnow)
+    error = Column(Text, nullable=True)
+    received_at = Column(DateTime, nullable=False, default=dt.datetime.utcnow)
+    processed_at = Column(DateTime, nullable=True, index=True)
+
+    __table_args__ = (
+        Index("ix_telegram_updates_claim", "status", "available_at"),
+    )
+
+
+# Bump the shared catalog version after any commit that touched gifts or
+# media, whether through the ORM or a bulk insert/update/delete statement.
+# Cached fragments are keyed by this version, so every worker drops them.
+CATALOG_TABLES = {"gifts", "telegram_media"}
+
+
+def _touches_catalog(objects) -> bool:
+    return any(getattr(obj, "__tablename__", None) in CATALOG_TABLES for obj in objects)
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _mark_catalog_flush(session, flush_context) -> None:
+    if _touches_catalog(session.new) or _touches_catalog(session.dirty) or _touches_catalog(session.deleted):
+        session.info["catalog_changed"] = True
+
+
+@event.listens_for(SessionLocal, "do_orm_execute")
+def _mark_catalog_statement(orm_execute_state) -> None:
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(orm_execute_state.statement, "table", None)
+        if getattr(table, "name", None) in CATALOG_TABLES:
+            orm_execute_state.session.info["catalog_changed"] = True
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _bump_catalog_version(session) -> None:
+    if session.info.pop("catalog_changed", False):
+        bump_catalog_version()
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _forget_catalog_changes(session) -> None:
+    session.info.pop("catalog_changed", None)
+
+
+# Bump whenever models, indexes, migrations or search DDL change. On SQLite
+# the applied version is kept in PRAGMA user_version and init_db() returns
+# early when it matches, so booting a worker costs one PRAGMA.
+SCHEMA_VERSION = 6
+
+
+def _applied_schema_version() -> Optional[int]:
+    if engine.dialect.name != "sqlite":
+        return None
+    with engine.connect() as conn:
+        return conn.exec_driver_sql("PRAGMA user_version").scalar()
+
+
 def init_db() -> None:
+    applied = _applied_schema_version()
+    if applied == SCHEMA_VERSION:
+        return
     Base.metadata.create_all(bind=engine)
+    _migrate()
+    if applied and applied < 6:
+        # Before schema 6 failed transcodes were stored as path=NULL too, and
+        # never retried; forget all of them once, outcomes are stored again
+        with engine.begin() as conn:
+            conn.execute(text("DELETE FROM media_renditions WHERE path IS NULL"))
+    _init_change_log()
+    init_search(engine)
+    if engine.dialect.name == "sqlite":
+        with engine.begin() as conn:
+            conn.exec_driver_sql(f"PRAGMA user_version = {int(SCHEMA_VERSION)}")
+
+
+def _migrate() -> None:
+    # create_all() does not add columns to existing tables
+    columns = {c["name"] for c in inspect(engine).get_columns("gifts")}
+    if "updated_at" not in columns:
+        with engine.begin() as conn:
+            conn.execute(text("ALTER TABLE gifts ADD COLUMN updated_at DATETIME"))
+            conn.execute(text("UPDATE gifts SET updated_at = created_at WHERE updated_at IS NULL"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_gifts_updated_at ON gifts (updated_at)"))
+    columns = {c["name"] for c in inspect(engine).get_columns("telegram_media")}
+    if "file_path_checked_at" not in columns:
+        with engine.begin() as conn:
+            conn.execute(text("ALTER TABLE telegram_media ADD COLUMN file_path_checked_at DATETIME"))
+    with engine.begin() as conn:
+        # Sort keys of the admin list
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_gifts_title ON gifts (title)"))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_gifts_created_at ON gifts (created_at)"))
+        # Joins on file_unique_id (renditions, metadata, reconcile)
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_telegram_media_file_unique_id ON telegram_media (file_unique_id)"))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_telegram_media_file_path_checked_at ON telegram_media (file_path_checked_at)"))
+
+
+# DELETE + INSERT rather than INSERT OR REPLACE: a conflict clause on the
+# outer statement (INSERT OR IGNORE INTO gifts ...) would override the
+# trigger's own and silently drop the change.
+_CHANGE_LOG_DDL = [
+    """
+    CREATE TRIGGER IF NOT EXISTS gifts_log_ai AFTER INSERT ON gifts BEGIN
+      DELETE FROM gift_changes WHERE gift_id = new.id;
+      INSERT INTO gift_changes(gift_id, deleted) VALUES (new.id, 0);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS gifts_log_au AFTER UPDATE ON gifts BEGIN
+      DELETE FROM gift_changes WHERE gift_id IN (old.id, new.id);
+      INSERT INTO gift_changes(gift_id, deleted) SELECT old.id, 1 WHERE old.id != new.id;
+      INSERT INTO gift_changes(gift_id, deleted) VALUES (new.id, 0);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS gifts_log_ad AFTER DELETE ON gifts BEGIN
+      DELETE FROM gift_changes WHERE gift_id = old.id;
+      INSERT INTO gift_changes(gift_id, deleted) VALUES (old.id, 1);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS telegram_media_log_ai AFTER INSERT ON telegram_media BEGIN
+      DELETE FROM media_changes WHERE media_id = new.id;
+      INSERT INTO media_changes(media_id, deleted) VALUES (new.id, 0);
+    END
+    """,
+    # Only columns clients see; file_path_checked_at bookkeeping is not a change
+    """
+    CREATE TRIGGER IF NOT EXISTS telegram_media_log_au AFTER UPDATE ON telegram_media
+    WHEN old.id IS NOT new.id OR old.file_id IS NOT new.file_id OR old.file_unique_id IS NOT new.file_unique_id
+      OR old.file_path IS NOT new.file_path OR old.mime_type IS NOT new.mime_type OR old.caption IS NOT new.caption
+      OR old.width IS NOT new.width OR old.height IS NOT new.height OR old.size IS NOT new.size
+    BEGIN
+      DELETE FROM media_changes WHERE media_id IN (old.id, new.id);
+      INSERT INTO media_changes(media_id, deleted) SELECT old.id, 1 WHERE old.id != new.id;
+      INSERT INTO media_changes(media_id, deleted) VALUES (new.id, 0);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS telegram_media_log_ad AFTER DELETE ON telegram_media BEGIN
+      DELETE FROM media_changes WHERE media_id = old.id;
+      INSERT INTO media_changes(media_id, deleted) VALUES (old.id, 1);
+    END
+    """,
+]
+
+
+def _init_change_log() -> None:
+    if engine.dialect.name != "sqlite":
+        return
+    with engine.begin() as conn:
+        for ddl in _CHANGE_LOG_DDL:
+            conn.exec_driver_sql(ddl)
+        # Schema 3 kept deletions in gift_tombstones and paged them separately
+        if inspect(conn).has_table("gift_tombstones"):
+            conn.exec_driver_sql(
+                "INSERT INTO gift_changes(gift_id, deleted) "
+                "SELECT gift_id, 1 FROM gift_tombstones "
+                "WHERE gift_id NOT IN (SELECT id FROM gifts) AND gift_id NOT IN (SELECT gift_id FROM gift_changes) "
+                "GROUP BY gift_id ORDER BY max(id)"
+            )
+            conn.exec_driver_sql("DROP TABLE gift_tombstones")
+        # Rows written before the triggers existed
+        conn.exec_driver_sql(
+            "INSERT INTO gift_changes(gift_id, deleted) "
+            "SELECT id, 0 FROM gifts WHERE id NOT IN (SELECT gift_id FROM gift_changes) ORDER BY updated_at, id"
+        )
+        conn.exec_driver_sql(
+            "INSERT INTO media_changes(media_id, deleted) "
+            "SELECT id, 0 FROM telegram_media WHERE id NOT IN (SELECT media_id FROM media_changes) ORDER BY id"
+        )
@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+import base64
+import binascii
 import os
 from typing import Optional
 
@@ -24,11 +26,35 @@ def _client_ip(request: Request) -> str:
     return request.client.host if request.client else ""
 
 
+def _ip_allowed(request: Request) -> bool:
+    return DISABLE_IP_CHECK or _client_ip(request) == ADMIN_ALLOWED_IP
+
+
+def _credentials_ok(username: str, password: str) -> bool:
+    return username == ADMIN_USER and password == ADMIN_PASS
+
+
+def is_admin(request: Request) -> bool:
+    """Same checks as admin_guard, but returns False instead of raising.
+
+    For middleware, which runs outside FastAPI's dependency injection.
+    """
+    if not _ip_allowed(request):
+        return False
+    scheme, _, encoded = (request.headers.get("authorization") or "").partition(" ")
+    if scheme.lower() != "basic":
+        return False
+    try:
+        username, _, password = base64.b64decode(encoded).decode("utf-8").partition(":")
+    except (binascii.Error, UnicodeDecodeError):
+        return False
+    return _credentials_ok(username, password)
+
+
 def admin_guard(request: Request, creds: HTTPBasicCredentials = Depends(basic_auth)) -> None:
-    ip = _client_ip(request)
-    if not DISABLE_IP_CHECK and ip != ADMIN_ALLOWED_IP:
+    if not _ip_allowed(request):
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden: Admin IP not allowed")
 
-    if not (creds.username == ADMIN_USER and creds.password == ADMIN_PASS):
+    if not _credentials_ok(creds.username, creds.password):
         # Ask for auth again
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Unauthorized", headers={"WWW-Authenticate": "Basic"})
@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import threading
+from typing import Any, AsyncIterator, Dict, Optional, Set
+
+
+# In-process fan-out of catalog events to server-sent-event subscribers.
+# publish() is safe to call from sync endpoints running in the threadpool;
+# each subscriber owns a bounded queue on its event loop. A subscriber that
+# falls behind is disconnected (EventSource reconnects by itself) instead of
+# buffering without limit.
+
+HEARTBEAT_SECONDS = 15.0
+QUEUE_SIZE = 256
+
+
+class Subscription:
+    def __init__(self, loop: asyncio.AbstractEventLoop, maxsize: int) -> None:
+        self.loop = loop
+        self.queue: asyncio.Queue[Optional[str]] = asyncio.Queue(maxsize=maxsize)
+        self.closed = False
+
+    def _put(self, message: Optional[str]) -> None:
+        if self.closed:
+            return
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # Too slow: drop everything queued and tell the stream to end
+            self.closed = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+
+class Broadcaster:
+    def __init__(self, queue_size: int = QUEUE_SIZE) -> None:
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._subscribers: Set[Subscription] = set()
+
+    def subscribe(self) -> Subscription:
+        sub = Subscription(asyncio.get_running_loop(), self.queue_size)
+        with self._lock:
+            self._subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        with self._lock:
+            self._subscribers.discard(sub)
+
+    @property
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return len(self._subscribers)
+
+    def publish(self, event: str, data: Dict[str, Any]) -> None:
+        # Serialize once for all subscribers
+        message = f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for sub in subscribers:
+            try:
+                sub.loop.call_soon_threadsafe(sub._put, message)
+            except RuntimeError:
+                # Loop already closed
+                self.unsubscribe(sub)
+
+    async def stream(self, heartbeat: float = HEARTBEAT_SECONDS) -> AsyncIterator[str]:
+        sub = self.subscribe()
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    message = await asyncio.wait_for(sub.queue.get(), timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                if message is None:
+                    break
+                yield message
+        finally:
+            self.unsubscribe(sub)
+
+
+broadcaster = Broadcaster()
@@ -0,0 +1,297 @@
+from __future__ import annotations
+
+import argparse
+import datetime as dt
+import json
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.engine import Row
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.orm import Session
+
+from .database import SessionLocal, init_db, TelegramMedia, TelegramState, TelegramUpdate
+from .telegram_client import TelegramClient
+
+
+# Telegram ingestion through a durable journal.
+# Producer: fetch_updates() calls getUpdates and stores the raw updates in
+# telegram_updates in the same transaction that advances the offset, so a
+# crash before the commit simply gets the same updates again on the next call
+# (duplicates are dropped by update_id), and nothing is acknowledged unsaved.
+# Consumers: drain() runs worker threads that claim pending rows with a lease,
+# turn them into telegram_media rows and mark them done. Processing is
+# idempotent (file_id is unique), so a row whose consumer died is simply
+# claimed again once its lease expires.
+#
+# Run with: python -m app.ingest --workers 4 [--follow]
+# --follow long-polls Telegram and drains continuously; without it the
+# journal is drained once. Media stored by this process is not announced on
+# the web workers' /events/catalog (their broadcaster is in-process); clients
+# pick it up from /api/telegram/animations/changes.
+
+CLAIM_BATCH = 10
+LEASE = dt.timedelta(minutes=5)
+MAX_ATTEMPTS = 5
+RETRY_BACKOFF = dt.timedelta(seconds=30)
+POLL_TIMEOUT = 25
+# The database runs in WAL mode (app.database), so open readers such as a
+# streamed page never block claim(); it only waits for other writers, up to
+# the busy timeout. Retrying is the fallback for a writer holding the lock
+# even longer, not the normal path.
+CLAIM_RETRIES = 3
+CLAIM_BACKOFF = 0.5
+# Passes of process() when a concurrent consumer keeps inserting the same files
+CONFLICT_RETRIES = 3
+
+
+class IngestError(Exception):
+    pass
+
+
+def media_items(update: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Animations/documents of one update as telegram_media column values."""
+    msg = update.get("message") or update.get("channel_post") or {}
+    candidates = []
+    if msg.get("animation"):
+        candidates.append(msg["animation"])
+    if isinstance(msg.get("document"), dict):
+        candidates.append(msg["document"])
+    return [
+        {
+            "file_id": item["file_id"],
+            "file_unique_id": item.get("file_unique_id"),
+            "mime_type": item.get("mime_type"),
+            "width": item.get("width"),
+            "height": item.get("height"),
+            "size": item.get("file_size"),
+            "caption": msg.get("caption"),
+        }
+        for item in candidates
+        if item.get("file_id")
+    ]
+
+
+# Producer
+
+def journal(db: Session, updates: List[Dict[str, Any]]) -> int:
+    """Store raw updates and advance the offset in one commit; returns new rows."""
+    ids = [u["update_id"] for u in updates if isinstance(u.get("update_id"), int)]
+    if not ids:
+        return 0
+    known = set(db.execute(select(TelegramUpdate.update_id).where(TelegramUpdate.update_id.in_(ids))).scalars())
+    added = 0
+    for upd in updates:
+        update_id = upd.get("update_id")
+        if isinstance(update_id, int) and update_id not in known:
+            known.add(update_id)
+            db.add(TelegramUpdate(update_id=update_id, payload=json.dumps(upd, ensure_ascii=False)))
+            added += 1
+    state = db.get(TelegramState, 1)
+    if state is None:
+        state = TelegramState(id=1, last_update_id=max(ids))
+    else:
+        state.last_update_id = max(state.last_update_id or 0, max(ids))
+    db.add(state)
+    db.commit()
+    return added
+
+
+def fetch_updates(db: Session, client: TelegramClient, timeout: int = 0) -> int:
+    state: Optional[TelegramState] = db.get(TelegramState, 1)
+    offset: Optional[int] = (state.last_update_id + 1) if state and state.last_update_id is not None else None
+    j = client.get_updates(offset=offset, timeout=timeout)
+    if not j.get("ok"):
+        raise IngestError(str(j))
+    return journal(db, j.get("result", []))
+
+
+# Consumers
+
+def claim(db: Session, limit: int = CLAIM_BATCH) -> List[Row]:
+    """Atomically lease up to ``limit`` due rows to the caller."""
+    now = dt.datetime.utcnow()
+    due = (
+        select(TelegramUpdate.update_id)
+        .where(TelegramUpdate.status.in_(("pending", "processing")), TelegramUpdate.available_at <= now)
+        .order_by(TelegramUpdate.update_id)
+        .limit(limit)
+        .scalar_subquery()
+    )
+    rows = db.execute(
+        update(TelegramUpdate)
+        .where(TelegramUpdate.update_id.in_(due))
+        .values(status="processing", attempts=TelegramUpdate.attempts + 1, available_at=now + LEASE)
+        .returning(TelegramUpdate.update_id, TelegramUpdate.payload, TelegramUpdate.attempts)
+    ).all()
+    db.commit()
+    return sorted(rows, key=lambda r: r.update_id)
+
+
+def _claim_with_retry(db: Session) -> List[Row]:
+    for attempt in range(CLAIM_RETRIES):
+        try:
+            return claim(db)
+        except OperationalError:
+            db.rollback()
+            if attempt == CLAIM_RETRIES - 1:
+                raise
+            time.sleep(CLAIM_BACKOFF * 2 ** attempt)
+    return []
+
+
+def _resolve_file_path(client: TelegramClient, file_id: str) -> Optional[str]:
+    try:
+        fj = client.get_file(file_id)
+    except Exception:
+        return None
+    return fj["result"].get("file_path") if fj.get("ok") else None
+
+
+def process(db: Session, client: TelegramClient, update_id: int, payload: str) -> List[TelegramMedia]:
+    """Store the media of one journaled update and mark it done, in one commit."""
+    for _ in range(CONFLICT_RETRIES):
+        created = []
+        for values in media_items(json.loads(payload)):
+            # Replays skip both the getFile call and the insert
+            if db.execute(select(TelegramMedia.id).where(TelegramMedia.file_id == values["file_id"])).first():
+                continue
+            created.append(TelegramMedia(file_path=_resolve_file_path(client, values["file_id"]), **values))
+        db.add_all(created)
+        db.execute(
+            update(TelegramUpdate)
+            .where(TelegramUpdate.update_id == update_id)
+            .values(status="done", processed_at=dt.datetime.utcnow(), error=None)
+        )
+        try:
+            db.commit()
+        except IntegrityError:
+            # Another consumer stored one of the files meanwhile; the existence
+            # check skips it on the next pass. (No SAVEPOINT per row: on SQLite
+            # it opens a deferred transaction that fails with "database is
+            # locked" instead of waiting for a concurrent writer.)
+            db.rollback()
+            continue
+        return created
+    raise IngestError(f"file_id conflicts persisted after {CONFLICT_RETRIES} passes")
+
+
+def _fail(db: Session, update_id: int, attempts: int, error: Exception) -> None:
+    db.rollback()
+    final = attempts >= MAX_ATTEMPTS
+    db.execute(
+        update(TelegramUpdate)
+        .where(TelegramUpdate.update_id == update_id)
+        .values(
+            status="failed" if final else "pending",
+            available_at=dt.datetime.utcnow() + RETRY_BACKOFF * attempts,
+            error=f"{type(error).__name__}: {error}",
+        )
+    )
+    db.commit()
+
+
+def drain(workers: int = 4, on_media: Optional[Callable[[TelegramMedia], None]] = None) -> Dict[str, int]:
+    """Process due journal rows with ``workers`` threads until none are left.
+
+    ``on_media`` is called for every new telegram_media row after its commit.
+    """
+    stats = {"processed": 0, "media": 0, "retried": 0, "failed": 0, "claim_failed": 0}
+    lock = threading.Lock()
+
+    def count(key: str, amount: int = 1) -> None:
+        with lock:
+            stats[key] += amount
+
+    def worker() -> None:
+        client = TelegramClient()
+        db = SessionLocal()
+        try:
+            while True:
+                try:
+                    rows = _claim_with_retry(db)
+                except OperationalError as e:
+                    # Rows this worker still holds are claimed again once
+                    # their lease expires
+                    count("claim_failed")
+                    print(f"ingest: {threading.current_thread().name} gave up claiming: {e}", file=sys.stderr)
+                    return
+                if not rows:
+                    return
+                for row in rows:
+                    try:
+                        created = process(db, client, row.update_id, row.payload)
+                    except Exception as e:
+                        _fail(db, row.update_id, row.attempts, e)
+                        count("failed" if row.attempts >= MAX_ATTEMPTS else "retried")
+                        continue
+                    count("processed")
+                    count("media", len(created))
+                    if on_media:
+                        for media in created:
+                            on_media(media)
+        finally:
+            db.close()
+
+    threads = [threading.Thread(target=worker, name=f"ingest-{i}", daemon=True) for i in range(max(1, workers))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return stats
+
+
+def queue_stats(db: Session) -> Dict[str, int]:
+    rows = db.execute(select(TelegramUpdate.status, func.count()).group_by(TelegramUpdate.status))
+    return {status: n for status, n in rows}
+
+
+def purge_processed(db: Session, older_than: dt.timedelta = dt.timedelta(days=7), batch_size: int = 500) -> int:
+    """Delete done rows in small batches; failed rows are kept for inspection."""
+    cutoff = dt.datetime.utcnow() - older_than
+    deleted = 0
+    while True:
+        ids = list(
+            db.execute(
+                select(TelegramUpdate.update_id)
+                .where(TelegramUpdate.status == "done", TelegramUpdate.processed_at < cutoff)
+                .limit(batch_size)
+            ).scalars()
+        )
+        if not ids:
+            return deleted
+        db.execute(delete(TelegramUpdate).where(TelegramUpdate.update_id.in_(ids)))
+        db.commit()
+        deleted += len(ids)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Drain the Telegram update journal")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--follow", action="store_true", help="long-poll getUpdates and keep draining")
+    args = parser.parse_args(argv)
+
+    init_db()
+    if not args.follow:
+        stats = drain(workers=args.workers)
+        print(", ".join(f"{k}: {v}" for k, v in stats.items()))
+        return 0
+
+    client = TelegramClient()
+    while True:
+        db = SessionLocal()
+        try:
+            fetch_updates(db, client, timeout=POLL_TIMEOUT)
+        except Exception as e:
+            print(f"getUpdates failed: {e}")
+            time.sleep(5)
+        finally:
+            db.close()
+        drain(workers=args.workers)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
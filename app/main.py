@@ -1,23 +1,49 @@
 from __future__ import annotations
 
 import os
+import json
 import itertools
-import requests
-from typing import List, Optional
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from urllib.parse import quote
+from typing import Dict, List, Optional, Tuple
 
-from fastapi import Depends, FastAPI, Form, HTTPException, Request
-from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, StreamingResponse
+from fastapi import BackgroundTasks, Depends, FastAPI, File, Form, HTTPException, Request, UploadFile
+from fastapi.responses import FileResponse, HTMLResponse, RedirectResponse, JSONResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from sqlalchemy import select, delete
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+from markupsafe import Markup
+from sqlalchemy import func, select, delete, update
 from sqlalchemy.orm import Session
 
-from .database import Base, SessionLocal, engine, init_db, Gift, TelegramMedia, TelegramState
+from .admission import AdmissionMiddleware, controller as admission
+from .cache import catalog_state, catalog_version, get_cache
+from .database import DATA_DIR, RENDITIONS_DIR, Base, SessionLocal, engine, init_db, Gift, MediaMetadata, MediaRendition, TelegramMedia
 from .deps import admin_guard
+from .events import broadcaster
+from .media import (
+    CACHE_CONTROL,
+    MediaError,
+    MediaMeta,
+    Rendition,
+    answer_from_meta,
+    choose_rendition,
+    is_not_modified,
+    open_upstream,
+    parse_width_hint,
+    upstream_response,
+)
+from .profiling import ProfilingMiddleware, list_profiles, profile_path
+from .sync import MAX_PAGE as SYNC_MAX_PAGE, CursorError, gift_changes, parse_cursor, media_changes
+from .search import KINDS as SEARCH_KINDS, search as search_catalog
 from .telegram_client import TelegramClient
 
 
 app = FastAPI(title="NFT Gifts Store")
+app.add_middleware(ProfilingMiddleware)
+# Added last so it runs first: rejected requests skip everything else
+app.add_middleware(AdmissionMiddleware)
 
 # Static files and templates
 BASE_DIR = os.path.dirname(os.path.dirname(__file__))
@@ -25,7 +51,17 @@ STATIC_DIR = os.path.join(BASE_DIR, "static")
 TEMPLATES_DIR = os.path.join(BASE_DIR, "templates")
 
 app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
-templates = Jinja2Templates(directory=TEMPLATES_DIR)
+
+# Compiled templates are kept on disk so new workers skip Jinja compilation
+JINJA_CACHE_DIR = os.path.join(DATA_DIR, "jinja_cache")
+os.makedirs(JINJA_CACHE_DIR, exist_ok=True)
+templates = Jinja2Templates(
+    env=Environment(
+        loader=FileSystemLoader(TEMPLATES_DIR),
+        autoescape=True,
+        bytecode_cache=FileSystemBytecodeCache(JINJA_CACHE_DIR),
+    )
+)
 
 
 # Dependency: DB session per request
@@ -43,11 +79,135 @@ def on_startup():
     init_db()
 
 
+# Large catalog pages are rendered with Jinja's generate() over a yield_per
+# cursor so the first bytes go out before the whole table is read.
+STREAM_TEMPLATES = os.getenv("APP_STREAM_TEMPLATES", "1") == "1"
+STREAM_CHUNK_SIZE = 16 * 1024
+STREAM_YIELD_PER = 200
+
+
+def _iter_rendered(template, context: dict, db: Session):
+    try:
+        buf: List[str] = []
+        size = 0
+        for piece in template.generate(context):
+            buf.append(piece)
+            size += len(piece)
+            if size >= STREAM_CHUNK_SIZE:
+                yield "".join(buf)
+                buf, size = [], 0
+        if buf:
+            yield "".join(buf)
+    finally:
+        db.close()
+
+
+def _render_catalog(request: Request, name: str, context: dict, db: Session):
+    """Render a template that iterates a live DB cursor; takes ownership of ``db``."""
+    context = {"request": request, **context}
+    if not STREAM_TEMPLATES:
+        try:
+            return templates.TemplateResponse(name, context)
+        finally:
+            db.close()
+    template = templates.get_template(name)
+    return StreamingResponse(_iter_rendered(template, context, db), media_type="text/html; charset=utf-8")
+
+
+# Rendered fragments live in the shared cache, keyed by the catalog version
+# that every catalog write bumps (see app.database).
+FRAGMENT_TTL = 10 * 60
+
+
+def _cached_fragment(name: str, render) -> str:
+    version = catalog_version()
+    if version is None:
+        return render()
+    key = f"fragment:{name}:v{version}"
+    cache = get_cache()
+    hit = cache.get(key)
+    if hit is not None:
+        return hit.decode("utf-8")
+    value = render()
+    cache.set(key, value, ttl=FRAGMENT_TTL)
+    return value
+
+
+# HTTP validators for the public catalog responses, derived from the same
+# shared version, so every worker (and a CDN in front of them) agrees on them.
+# Set APP_RELEASE per deploy when templates or JSON shapes change.
+CATALOG_CDN_MAX_AGE = int(os.getenv("APP_CATALOG_CDN_MAX_AGE", "30"))
+CATALOG_CACHE_CONTROL = f"public, max-age=0, must-revalidate, s-maxage={CATALOG_CDN_MAX_AGE}"
+RELEASE = os.getenv("APP_RELEASE", "")
+
+
+def _modified_since(if_modified_since: Optional[str], modified: int) -> bool:
+    if not if_modified_since:
+        return True
+    try:
+        return modified > parsedate_to_datetime(if_modified_since).timestamp()
+    except (TypeError, ValueError):
+        return True
+
+
+def _catalog_validators(request: Request) -> Tuple[Optional[Response], Dict[str, str]]:
+    """(304 response if the client's copy is current, headers for a full response)."""
+    headers = {"Cache-Control": CATALOG_CACHE_CONTROL}
+    state = catalog_state()
+    if state is None:
+        # Cache backend down: serve in full, without validators to revalidate
+        return None, headers
+    version, modified = state
+    tag = f'"{RELEASE}.{version}"' if RELEASE else f'"{version}"'
+    headers["ETag"] = f"W/{tag}"
+    # Last-Modified has one-second resolution, so a change later in the same
+    # second would look unmodified; only send it once that second is over
+    settled = time.time() - modified >= 1
+    if settled:
+        headers["Last-Modified"] = formatdate(int(modified), usegmt=True)
+    if_none_match = request.headers.get("if-none-match")
+    # If-Modified-Since only counts when there is no If-None-Match (RFC 9110)
+    if if_none_match is not None:
+        fresh = is_not_modified(if_none_match, tag)
+    else:
+        fresh = settled and not _modified_since(request.headers.get("if-modified-since"), int(modified))
+    return (Response(status_code=304, headers=headers) if fresh else None), headers
+
+
+def _render_media_cards(medias: List[TelegramMedia], q: Optional[str] = None) -> str:
+    return templates.get_template("_media_cards.html").render(medias=medias, q=q)
+
+
+def _gifts_cursor(db: Session):
+    stmt = select(Gift).order_by(Gift.created_at.desc()).execution_options(yield_per=STREAM_YIELD_PER)
+    return db.execute(stmt).scalars()
+
+
 @app.get("/", response_class=HTMLResponse)
-def index(request: Request, db: Session = Depends(get_db)):
-    gifts: List[Gift] = list(db.execute(select(Gift).order_by(Gift.created_at.desc())).scalars())
-    medias: List[TelegramMedia] = list(db.execute(select(TelegramMedia).order_by(TelegramMedia.id.desc()).limit(18)).scalars())
-    return templates.TemplateResponse("index.html", {"request": request, "gifts": gifts, "medias": medias})
+def index(request: Request, q: Optional[str] = None):
+    not_modified, validators = _catalog_validators(request)
+    if not_modified is not None:
+        return not_modified
+    # The session outlives this function: it is closed once the body is streamed
+    db = SessionLocal()
+    try:
+        q = (q or "").strip() or None
+        if q:
+            gifts = [g for _, g in _load_search_hits(db, search_catalog(db, q, kind="gift", limit=100))]
+            medias = [m for _, m in _load_search_hits(db, search_catalog(db, q, kind="media", limit=18))]
+            media_cards = _render_media_cards(medias, q)
+        else:
+            media_cards = _cached_fragment(
+                "index:medias",
+                lambda: _render_media_cards(list(db.execute(select(TelegramMedia).order_by(TelegramMedia.id.desc()).limit(18)).scalars())),
+            )
+            gifts = _gifts_cursor(db)
+    except Exception:
+        db.close()
+        raise
+    response = _render_catalog(request, "index.html", {"gifts": gifts, "media_cards": Markup(media_cards), "q": q}, db)
+    response.headers.update(validators)
+    return response
 
 
 @app.post("/send", response_class=HTMLResponse)
@@ -95,39 +255,43 @@ def send_gift(
 
 
 # Secure proxy to serve Telegram files without exposing bot token
-@app.get("/media/telegram/{file_id}")
-def media_proxy(file_id: str, db: Session = Depends(get_db)):
+@app.api_route("/media/telegram/{file_id}", methods=["GET", "HEAD"])
+def media_proxy(file_id: str, request: Request, w: Optional[str] = None, db: Session = Depends(get_db)):
     client = TelegramClient()
 
     # Try to guess mime type from stored media
     mime: Optional[str] = None
+    meta: Optional[MediaMeta] = None
     media: Optional[TelegramMedia] = db.execute(select(TelegramMedia).where(TelegramMedia.file_id == file_id)).scalar_one_or_none()
+    if media and media.file_unique_id:
+        probed = db.execute(select(MediaMetadata).where(MediaMetadata.file_unique_id == media.file_unique_id)).scalar_one_or_none()
+        if probed:
+            meta = MediaMeta(probed.mime_type, probed.bytes, probed.sha256)
     if media and media.mime_type:
         mime = media.mime_type
+    elif meta and meta.mime_type:
+        mime = meta.mime_type
+
+    # ?w=<display width> selects a smaller transcoded rendition when one exists
+    width_hint = parse_width_hint(w)
+    if media and media.file_unique_id and width_hint:
+        rows = db.execute(
+            select(MediaRendition).where(MediaRendition.file_unique_id == media.file_unique_id, MediaRendition.path.is_not(None))
+        ).scalars()
+        rendition = choose_rendition((Rendition(os.path.join(RENDITIONS_DIR, r.path), r.mime_type, r.width) for r in rows), width_hint)
+        if rendition and os.path.exists(rendition.path):
+            return FileResponse(rendition.path, media_type=rendition.mime_type or "video/mp4", headers={"Cache-Control": CACHE_CONTROL})
+
+    cached = answer_from_meta(request.method, request.headers.get("if-none-match"), meta, mime)
+    if cached is not None:
+        return cached
 
-    # Resolve path for the file_id
-    fj = client.get_file(file_id)
-    if not fj.get("ok"):
-        raise HTTPException(status_code=404, detail="Telegram file not found")
-    file_path: Optional[str] = fj["result"].get("file_path")
-    if not file_path:
-        raise HTTPException(status_code=404, detail="Telegram file path missing")
-
-    url = client.build_file_url(file_path)
     try:
-        tg_resp = requests.get(url, stream=True, timeout=30)
-        tg_resp.raise_for_status()
-    except Exception as e:
-        raise HTTPException(status_code=502, detail=f"Telegram fetch error: {e}")
-
-    def iter_stream():
-        for chunk in tg_resp.iter_content(chunk_size=64 * 1024):
-            if chunk:
-                yield chunk
+        tg_resp = open_upstream(client, file_id, media.file_path if media else None)
+    except MediaError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
 
-    headers = {"Cache-Control": "public, max-age=86400"}
-    content_type = mime or tg_resp.headers.get("Content-Type") or "application/octet-stream"
-    return StreamingResponse(iter_stream(), headers=headers, media_type=content_type)
+    return upstream_response(request.method, tg_resp, meta, mime)
 
 
 # Admin
@@ -136,10 +300,67 @@ def admin_root():
     return RedirectResponse(url="/admin/gifts", status_code=302)
 
 
+ADMIN_PER_PAGE = 50
+ADMIN_MAX_PER_PAGE = 200
+ADMIN_SORT_COLUMNS = {
+    "id": Gift.id,
+    "title": Gift.title,
+    "created_at": Gift.created_at,
+    "updated_at": Gift.updated_at,
+}
+# Fields that can be set for many gifts at once; an empty value clears the field
+BULK_EDIT_FIELDS = {
+    "description": "Описание",
+    "gif_url": "Ссылка на GIF/Видео",
+    "telegram_file_id": "Telegram file_id",
+}
+
+
+def _admin_return_url(return_to: Optional[str]) -> str:
+    # Only allow going back to the admin list itself
+    if return_to and return_to.startswith("/admin/gifts") and "//" not in return_to:
+        return return_to
+    return "/admin/gifts"
+
+
 @app.get("/admin/gifts", response_class=HTMLResponse)
-def admin_gifts(request: Request, db: Session = Depends(get_db), _=Depends(admin_guard)):
-    gifts: List[Gift] = list(db.execute(select(Gift).order_by(Gift.created_at.desc())).scalars())
-    return templates.TemplateResponse("admin/gifts_list.html", {"request": request, "gifts": gifts})
+def admin_gifts(
+    request: Request,
+    page: int = 1,
+    per_page: int = ADMIN_PER_PAGE,
+    sort: str = "created_at",
+    order: str = "desc",
+    db: Session = Depends(get_db),
+    _=Depends(admin_guard),
+):
+    if sort not in ADMIN_SORT_COLUMNS:
+        sort = "created_at"
+    if order not in ("asc", "desc"):
+        order = "desc"
+    per_page = max(1, min(per_page, ADMIN_MAX_PER_PAGE))
+    total: int = db.execute(select(func.count()).select_from(Gift)).scalar_one()
+    pages = max(1, -(-total // per_page))
+    page = max(1, min(page, pages))
+
+    column = ADMIN_SORT_COLUMNS[sort]
+    # id as tie-breaker keeps pages stable
+    ordering = (column.asc(), Gift.id.asc()) if order == "asc" else (column.desc(), Gift.id.desc())
+    stmt = select(Gift).order_by(*ordering).limit(per_page).offset((page - 1) * per_page)
+    gifts: List[Gift] = list(db.execute(stmt).scalars())
+    return templates.TemplateResponse(
+        "admin/gifts_list.html",
+        {
+            "request": request,
+            "gifts": gifts,
+            "page": page,
+            "pages": pages,
+            "total": total,
+            "per_page": per_page,
+            "sort": sort,
+            "order": order,
+            "bulk_fields": BULK_EDIT_FIELDS,
+        },
+    )
 
 
 @app.get("/admin/gifts/new", response_class=HTMLResponse)
@@ -160,6 +381,7 @@ def admin_create_gift(
     gift = Gift(title=title.strip(), description=(description or "").strip() or None, gif_url=(gif_url or None), telegram_file_id=(telegram_file_id or None))
     db.add(gift)
     db.commit()
+    broadcaster.publish("gift", _gift_dict(gift))
     return RedirectResponse(url="/admin/gifts", status_code=302)
 
 
@@ -202,97 +424,120 @@ def admin_delete_gift(gift_id: int, db: Session = Depends(get_db), _=Depends(adm
     return RedirectResponse(url="/admin/gifts", status_code=302)
 
 
+@app.post("/admin/gifts/bulk-delete")
+def admin_bulk_delete_gifts(
+    ids: List[int] = Form(default=[]),
+    return_to: Optional[str] = Form(default=None),
+    db: Session = Depends(get_db),
+    _=Depends(admin_guard),
+):
+    ids = list(set(ids))[:ADMIN_MAX_PER_PAGE]
+    if ids:
+        db.execute(delete(Gift).where(Gift.id.in_(ids)))
+        db.commit()
+    return RedirectResponse(url=_admin_return_url(return_to), status_code=302)
+
+
+@app.post("/admin/gifts/bulk-update")
+def admin_bulk_update_gifts(
+    ids: List[int] = Form(default=[]),
+    field: str = Form(...),
+    value: Optional[str] = Form(default=None),
+    return_to: Optional[str] = Form(default=None),
+    db: Session = Depends(get_db),
+    _=Depends(admin_guard),
+):
+    if field not in BULK_EDIT_FIELDS:
+        raise HTTPException(status_code=400, detail="Field cannot be bulk edited")
+    ids = list(set(ids))[:ADMIN_MAX_PER_PAGE]
+    if ids:
+        db.execute(update(Gift).where(Gift.id.in_(ids)).values({field: (value or "").strip() or None}))
+        db.commit()
+    return RedirectResponse(url=_admin_return_url(return_to), status_code=302)
+
+
+@app.post("/admin/gifts/import")
+def admin_import_gifts(
+    upload: UploadFile = File(...),
+    format: Optional[str] = Form(default=None),
+    db: Session = Depends(get_db),
+    _=Depends(admin_guard),
+):
+    from .catalog_io import FORMATS as CATALOG_FORMATS, detect_format, import_gifts
+
+    fmt = detect_format(upload.filename, format or None)
+    if not fmt:
+        raise HTTPException(status_code=400, detail=f"Unknown format, expected one of: {', '.join(CATALOG_FORMATS)}")
+    report = import_gifts(db, upload.file, fmt)
+    return {"inserted": report.inserted, "updated": report.updated, "skipped": report.skipped, "errors": report.errors}
+
+
+@app.get("/admin/gifts/export")
+def admin_export_gifts(format: str = "ndjson", _=Depends(admin_guard)):
+    from .catalog_io import FORMATS as CATALOG_FORMATS, export_gifts
+
+    if format not in CATALOG_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown format, expected one of: {', '.join(CATALOG_FORMATS)}")
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    headers = {"Content-Disposition": f'attachment; filename="gifts.{format}"'}
+    # export_gifts closes the session when the stream ends
+    return StreamingResponse(export_gifts(SessionLocal(), format), headers=headers, media_type=f"{media_type}; charset=utf-8")
+
+
+@app.get("/admin/cache")
+def admin_cache_stats(_=Depends(admin_guard)):
+    return {**get_cache().stats(), "catalog_version": catalog_version()}
+
+
+@app.get("/admin/admission")
+def admin_admission_stats(_=Depends(admin_guard)):
+    return admission.stats()
+
+
+@app.get("/admin/profiles")
+def admin_profiles(_=Depends(admin_guard)):
+    return {"profiles": list_profiles()}
+
+
+@app.get("/admin/profiles/{profile_id}")
+def admin_profile_download(profile_id: str, format: str = "txt", _=Depends(admin_guard)):
+    path = profile_path(profile_id, format)
+    if not path:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="text/plain; charset=utf-8", filename=f"profile-{profile_id}.{format}")
+
+
 # Telegram import pages
 @app.get("/admin/telegram", response_class=HTMLResponse)
 def admin_telegram(request: Request, db: Session = Depends(get_db), _=Depends(admin_guard)):
+    from .ingest import queue_stats
+
     medias: List[TelegramMedia] = list(db.execute(select(TelegramMedia).order_by(TelegramMedia.id.desc()).limit(50)).scalars())
-    return templates.TemplateResponse("admin/telegram.html", {"request": request, "medias": medias})
+    return templates.TemplateResponse("admin/telegram.html", {"request": request, "medias": medias, "journal": queue_stats(db)})
 
 
-@app.post("/admin/telegram/fetch")
-def admin_telegram_fetch(db: Session = Depends(get_db), _=Depends(admin_guard)):
-    client = TelegramClient()
+# Without a separate `python -m app.ingest` consumer, the journal is drained
+# by this process right after the fetch response is sent
+INGEST_INLINE = os.getenv("APP_INGEST_INLINE", "1") == "1"
+INGEST_WORKERS = int(os.getenv("APP_INGEST_WORKERS", "4"))
 
-    # Get last update id
-    state: Optional[TelegramState] = db.get(TelegramState, 1)
-    offset: Optional[int] = (state.last_update_id + 1) if state and state.last_update_id is not None else None
-
-    j = client.get_updates(offset=offset, timeout=0)
-    if not j.get("ok"):
-        raise HTTPException(status_code=502, detail=str(j))
-
-    result = j.get("result", [])
-    last_update_id: Optional[int] = None
-    saved = 0
-
-    for upd in result:
-        last_update_id = upd.get("update_id", last_update_id)
-        msg = upd.get("message") or upd.get("channel_post") or {}
-        if not msg:
-            continue
-        caption = msg.get("caption")
-
-        # animations
-        animation = msg.get("animation")
-        documents = msg.get("document")
-
-        candidates = []
-        if animation:
-            candidates.append(animation)
-        if isinstance(documents, dict):
-            candidates.append(documents)
-
-        for item in candidates:
-            mime = item.get("mime_type")
-            if not mime:
-                # Accept likely animations by extension too
-                pass
-            file_id = item.get("file_id")
-            file_unique_id = item.get("file_unique_id")
-            width = item.get("width")
-            height = item.get("height")
-            size = item.get("file_size")
-
-            if not file_id:
-                continue
-
-            # Resolve file_path
-            file_path = None
-            try:
-                fj = client.get_file(file_id)
-                if fj.get("ok"):
-                    file_path = fj["result"].get("file_path")
-            except Exception:
-                file_path = None
-
-            tm = TelegramMedia(
-                file_id=file_id,
-                file_unique_id=file_unique_id,
-                file_path=file_path,
-                mime_type=mime,
-                width=width,
-                height=height,
-                size=size,
-                caption=caption,
-            )
-            try:
-                db.add(tm)
-                db.commit()
-                saved += 1
-            except Exception:
-                db.rollback()
-                # likely unique constraint
-                pass
-
-    # Update offset state
-    if last_update_id is not None:
-        if not state:
-            state = TelegramState(id=1, last_update_id=last_update_id)
-        else:
-            state.last_update_id = last_update_id
-        db.add(state)
-        db.commit()
 
+def _drain_journal() -> None:
+    from .ingest import drain
+
+    drain(workers=INGEST_WORKERS, on_media=lambda m: broadcaster.publish("media", _media_dict(m)))
+
+
+@app.post("/admin/telegram/fetch")
+def admin_telegram_fetch(background_tasks: BackgroundTasks, db: Session = Depends(get_db), _=Depends(admin_guard)):
+    from .ingest import IngestError, fetch_updates
+
+    try:
+        fetch_updates(db, TelegramClient())
+    except IngestError as e:
+        raise HTTPException(status_code=502, detail=str(e))
+    if INGEST_INLINE:
+        background_tasks.add_task(_drain_journal)
     return RedirectResponse(url="/admin/telegram", status_code=302)
 
 
@@ -314,44 +559,134 @@ def admin_telegram_import(
     gift = Gift(title=title.strip(), description=(description or "").strip() or None, gif_url=gif_url, telegram_file_id=file_id)
     db.add(gift)
     db.commit()
+    broadcaster.publish("gift", _gift_dict(gift))
     return RedirectResponse(url="/admin/gifts", status_code=302)
 
 
 # JSON APIs
+def _gift_dict(g: Gift) -> dict:
+    return {
+        "id": g.id,
+        "title": g.title,
+        "description": g.description,
+        "gif_url": g.gif_url,
+        "telegram_file_id": g.telegram_file_id,
+        "updated_at": g.updated_at.isoformat() if g.updated_at else None,
+    }
+
+
+def _media_dict(m: TelegramMedia) -> dict:
+    # Through the media proxy: a Telegram file URL carries the bot token
+    return {
+        "id": m.id,
+        "file_id": m.file_id,
+        "file_unique_id": m.file_unique_id,
+        "file_path": m.file_path,
+        "url": f"/media/telegram/{quote(m.file_id, safe='')}" if m.file_path else None,
+        "mime_type": m.mime_type,
+        "caption": m.caption,
+        "width": m.width,
+        "height": m.height,
+        "size": m.size,
+    }
+
+
+def _load_search_hits(db: Session, hits) -> list:
+    # Fetch rows for ranked (kind, id) hits, keeping the ranking order
+    models = {"gift": Gift, "media": TelegramMedia}
+    found = {}
+    for kind, model in models.items():
+        ids = [i for k, i in hits if k == kind]
+        if ids:
+            for obj in db.execute(select(model).where(model.id.in_(ids))).scalars():
+                found[(kind, obj.id)] = obj
+    return [(h[0], found[h]) for h in hits if h in found]
+
+
 @app.get("/api/gifts")
-def api_gifts(db: Session = Depends(get_db)):
+def api_gifts(request: Request, db: Session = Depends(get_db)):
+    not_modified, validators = _catalog_validators(request)
+    if not_modified is not None:
+        return not_modified
     gifts: List[Gift] = list(db.execute(select(Gift).order_by(Gift.created_at.desc())).scalars())
-    return [
-        {
-            "id": g.id,
-            "title": g.title,
-            "description": g.description,
-            "gif_url": g.gif_url,
-            "telegram_file_id": g.telegram_file_id,
-        }
-        for g in gifts
-    ]
+    return JSONResponse([_gift_dict(g) for g in gifts], headers=validators)
 
 
 @app.get("/api/telegram/animations")
-def api_telegram_animations(db: Session = Depends(get_db)):
-    medias: List[TelegramMedia] = list(db.execute(select(TelegramMedia).order_by(TelegramMedia.id.desc()).limit(100)).scalars())
-    client = TelegramClient()
-    def to_url(m: TelegramMedia) -> Optional[str]:
-        if m.file_path:
-            return client.build_file_url(m.file_path)
-        return None
-    return [
-        {
-            "file_id": m.file_id,
-            "file_unique_id": m.file_unique_id,
-            "file_path": m.file_path,
-            "url": to_url(m),
-            "mime_type": m.mime_type,
-            "caption": m.caption,
-            "width": m.width,
-            "height": m.height,
-            "size": m.size,
-        }
-        for m in medias
-    ]
+def api_telegram_animations(request: Request, db: Session = Depends(get_db)):
+    not_modified, validators = _catalog_validators(request)
+    if not_modified is not None:
+        return not_modified
+
+    def render() -> str:
+        medias: List[TelegramMedia] = list(db.execute(select(TelegramMedia).order_by(TelegramMedia.id.desc()).limit(100)).scalars())
+        return json.dumps([_media_dict(m) for m in medias], ensure_ascii=False)
+
+    return Response(content=_cached_fragment("api:animations", render), media_type="application/json", headers=validators)
+
+
+@app.get("/api/gifts/changes")
+def api_gifts_changes(since: Optional[str] = None, limit: int = SYNC_MAX_PAGE, db: Session = Depends(get_db)):
+    # Clients apply "deleted" before "updated" and keep polling with the returned cursor
+    try:
+        cursor = parse_cursor(since)
+    except CursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    delta = gift_changes(db, cursor, limit=max(1, min(limit, SYNC_MAX_PAGE)))
+    if not delta.updated and not delta.deleted:
+        return Response(status_code=304)
+    return {
+        "cursor": str(delta.cursor),
+        "updated": [_gift_dict(g) for g in delta.updated],
+        "deleted": delta.deleted,
+        "has_more": delta.has_more,
+    }
+
+
+@app.get("/api/telegram/animations/changes")
+def api_telegram_animations_changes(since: Optional[str] = None, limit: int = SYNC_MAX_PAGE, db: Session = Depends(get_db)):
+    # Same protocol as /api/gifts/changes; "deleted" holds telegram_media ids
+    try:
+        cursor = parse_cursor(since)
+    except CursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    delta = media_changes(db, cursor, limit=max(1, min(limit, SYNC_MAX_PAGE)))
+    if not delta.updated and not delta.deleted:
+        return Response(status_code=304)
+    return {
+        "cursor": str(delta.cursor),
+        "updated": [_media_dict(m) for m in delta.updated],
+        "deleted": delta.deleted,
+        "has_more": delta.has_more,
+    }
+
+
+# Live feed of newly added gifts and Telegram animations
+@app.get("/events/catalog")
+def events_catalog():
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return StreamingResponse(broadcaster.stream(), headers=headers, media_type="text/event-stream")
+
+
+@app.get("/api/search")
+def api_search(q: str, kind: Optional[str] = None, limit: int = 20, offset: int = 0, db: Session = Depends(get_db)):
+    if kind is not None and kind not in SEARCH_KINDS:
+        raise HTTPException(status_code=400, detail=f"kind must be one of: {', '.join(SEARCH_KINDS)}")
+    limit = max(1, min(limit, 100))
+    offset = max(0, offset)
+    # Fetch one extra hit to know whether there is a next page
+    hits = search_catalog(db, q, kind=kind, limit=limit + 1, offset=offset)
+    has_more = len(hits) > limit
+    hits = hits[:limit]
+    items = []
+    for k, obj in _load_search_hits(db, hits):
+        item = _gift_dict(obj) if k == "gift" else _media_dict(obj)
+        item["type"] = k
+        items.append(item)
+    return {
+        "query": q,
+        "items": items,
+        "limit": limit,
+        "offset": offset,
+        "next_offset": offset + limit if has_more else None,
+    }
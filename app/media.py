@@ -0,0 +1,194 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, NamedTuple, Optional
+
+from starlette.responses import Response, StreamingResponse
+
+from .cache import get_cache
+from .telegram_client import TelegramClient
+
+if TYPE_CHECKING:
+    import requests
+
+
+# Shared between the main app and the standalone media edge: must stay free of
+# SQLAlchemy / Jinja imports so the edge process starts fast.
+
+CHUNK_SIZE = 64 * 1024
+CACHE_CONTROL = "public, max-age=86400"
+# Telegram keeps a resolved file link valid for at least an hour
+FILE_PATH_TTL = 50 * 60
+
+
+class MediaError(Exception):
+    def __init__(self, status_code: int, detail: str) -> None:
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def _file_path_key(file_id: str) -> str:
+    return f"tg:path:{file_id}"
+
+
+def resolve_file_path(client: TelegramClient, file_id: str) -> str:
+    import requests
+
+    try:
+        fj = client.get_file(file_id)
+    except requests.HTTPError as e:
+        # getFile answers 400 for file_ids Telegram does not know or no longer serves
+        if e.response is not None and e.response.status_code == 400:
+            raise MediaError(404, "Telegram file not found")
+        raise MediaError(502, f"Telegram getFile error: {e}")
+    except (requests.RequestException, ValueError) as e:
+        raise MediaError(502, f"Telegram getFile error: {e}")
+    if not fj.get("ok"):
+        raise MediaError(404, "Telegram file not found")
+    file_path: Optional[str] = fj["result"].get("file_path")
+    if not file_path:
+        raise MediaError(404, "Telegram file path missing")
+    get_cache().set(_file_path_key(file_id), file_path, ttl=FILE_PATH_TTL)
+    return file_path
+
+
+def _try_open(client: TelegramClient, file_path: str) -> Optional[requests.Response]:
+    import requests
+
+    try:
+        resp = requests.get(client.build_file_url(file_path), stream=True, timeout=30)
+    except Exception:
+        return None
+    if resp.ok:
+        return resp
+    resp.close()
+    return None
+
+
+def open_upstream(client: TelegramClient, file_id: str, file_path: Optional[str] = None) -> requests.Response:
+    """Open a streaming response for the file, resolving its path via getFile if needed.
+
+    Tries the stored ``file_path``, then the path resolved by any worker
+    (shared cache); both may have expired on Telegram's side, in which case the
+    path is resolved again once before giving up.
+    """
+    if file_path:
+        resp = _try_open(client, file_path)
+        if resp is not None:
+            return resp
+
+    cache = get_cache()
+    cached = cache.get(_file_path_key(file_id))
+    if cached and cached.decode("utf-8") != file_path:
+        resp = _try_open(client, cached.decode("utf-8"))
+        if resp is not None:
+            return resp
+    if cached:
+        cache.delete(_file_path_key(file_id))
+
+    import requests
+
+    file_path = resolve_file_path(client, file_id)
+    try:
+        resp = requests.get(client.build_file_url(file_path), stream=True, timeout=30)
+        resp.raise_for_status()
+    except Exception as e:
+        raise MediaError(502, f"Telegram fetch error: {e}")
+    return resp
+
+
+def iter_stream(resp: requests.Response) -> Iterator[bytes]:
+    try:
+        for chunk in resp.iter_content(chunk_size=CHUNK_SIZE):
+            if chunk:
+                yield chunk
+    finally:
+        resp.close()
+
+
+def content_type_for(resp: requests.Response, mime: Optional[str] = None) -> str:
+    return mime or resp.headers.get("Content-Type") or "application/octet-stream"
+
+
+class Rendition(NamedTuple):
+    path: str
+    mime_type: Optional[str]
+    width: Optional[int]
+
+
+def parse_width_hint(raw: Optional[str]) -> Optional[int]:
+    try:
+        width = int(raw) if raw else 0
+    except ValueError:
+        return None
+    return width if 0 < width <= 4096 else None
+
+
+def choose_rendition(renditions: Iterable[Rendition], width_hint: Optional[int]) -> Optional[Rendition]:
+    """Pick the narrowest rendition that still covers ``width_hint``.
+
+    Returns None (serve the original) when there is no hint or no rendition
+    is wide enough.
+    """
+    if not width_hint:
+        return None
+    usable = [r for r in renditions if r.path and r.width and r.width >= width_hint]
+    if not usable:
+        return None
+    return min(usable, key=lambda r: r.width)
+
+
+class MediaMeta(NamedTuple):
+    mime_type: Optional[str]
+    bytes: Optional[int]
+    sha256: Optional[str]
+
+
+def etag_for(meta: Optional[MediaMeta]) -> Optional[str]:
+    return f'"{meta.sha256}"' if meta and meta.sha256 else None
+
+
+def is_not_modified(if_none_match: Optional[str], etag: Optional[str]) -> bool:
+    if not if_none_match or not etag:
+        return False
+    candidates = [t.strip() for t in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+
+def meta_headers(meta: Optional[MediaMeta]) -> Dict[str, str]:
+    """Headers for the original file that can be sent without asking Telegram."""
+    headers = {"Cache-Control": CACHE_CONTROL}
+    etag = etag_for(meta)
+    if etag:
+        headers["ETag"] = etag
+    return headers
+
+
+def answer_from_meta(method: str, if_none_match: Optional[str], meta: Optional[MediaMeta], mime: Optional[str]) -> Optional[Response]:
+    """Answer conditional GETs and HEADs from the probed metadata alone, if possible."""
+    headers = meta_headers(meta)
+    if is_not_modified(if_none_match, etag_for(meta)):
+        return Response(status_code=304, headers=headers)
+    if method == "HEAD" and meta and meta.bytes is not None:
+        headers["Content-Length"] = str(meta.bytes)
+        return Response(headers=headers, media_type=mime or meta.mime_type or "application/octet-stream")
+    return None
+
+
+def stream_headers(resp: requests.Response, meta: Optional[MediaMeta]) -> Dict[str, str]:
+    headers = meta_headers(meta)
+    # Only trust the upstream length for the bytes actually being relayed
+    if resp.headers.get("Content-Length"):
+        headers["Content-Length"] = resp.headers["Content-Length"]
+    return headers
+
+
+def upstream_response(method: str, resp: requests.Response, meta: Optional[MediaMeta], mime: Optional[str]) -> Response:
+    """Relay an opened upstream file; a HEAD gets the headers without the body being downloaded."""
+    headers = stream_headers(resp, meta)
+    media_type = content_type_for(resp, mime)
+    if method == "HEAD":
+        # A StreamingResponse would still drain the whole upstream body
+        resp.close()
+        return Response(headers=headers, media_type=media_type)
+    return StreamingResponse(iter_stream(resp), headers=headers, media_type=media_type)
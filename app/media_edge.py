@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+from typing import List, Optional, Tuple
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import FileResponse, PlainTextResponse, Response
+from starlette.routing import Route
+
+from .media import (
+    CACHE_CONTROL,
+    MediaError,
+    MediaMeta,
+    Rendition,
+    answer_from_meta,
+    choose_rendition,
+    open_upstream,
+    parse_width_hint,
+    upstream_response,
+)
+from .telegram_client import TelegramClient
+
+
+# Standalone media proxy: serves only /media/telegram/{file_id}.
+# Run with: uvicorn app.media_edge:app --workers 4
+# Does not import SQLAlchemy, Jinja or the admin; metadata is read from the
+# main app's SQLite database in read-only mode.
+
+DATA_DIR = os.getenv("APP_DATA_DIR", "/workspace/data")
+RENDITIONS_DIR = os.path.join(DATA_DIR, "renditions")
+DB_URL = os.getenv("APP_DATABASE_URL", f"sqlite:///{os.path.join(DATA_DIR, 'app.db')}")
+
+
+def _sqlite_path(url: str) -> Optional[str]:
+    prefix = "sqlite:///"
+    if not url.startswith(prefix):
+        return None
+    return url[len(prefix):] or None
+
+
+class MetadataReader:
+    """Read-only lookups of media rows, probed metadata and renditions."""
+
+    def __init__(self, db_path: Optional[str]) -> None:
+        self.db_path = db_path
+        self._local = threading.local()
+
+    def _conn(self) -> Optional[sqlite3.Connection]:
+        if not self.db_path or not os.path.exists(self.db_path):
+            return None
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, check_same_thread=False)
+            self._local.conn = conn
+        return conn
+
+    def lookup(self, file_id: str) -> Tuple[Optional[str], Optional[str], Optional[MediaMeta]]:
+        """(mime_type, file_path, probed metadata) for a file_id."""
+        try:
+            conn = self._conn()
+            if conn is None:
+                return None, None, None
+            row = conn.execute(
+                "SELECT m.mime_type, m.file_path, md.mime_type, md.bytes, md.sha256 FROM telegram_media m"
+                " LEFT JOIN media_metadata md ON md.file_unique_id = m.file_unique_id"
+                " WHERE m.file_id = ?",
+                (file_id,),
+            ).fetchone()
+        except sqlite3.Error:
+            return None, None, None
+        if not row:
+            return None, None, None
+        meta = MediaMeta(row[2], row[3], row[4]) if row[4] else None
+        return row[0] or row[2], row[1], meta
+
+    def renditions(self, file_id: str) -> List[Rendition]:
+        try:
+            conn = self._conn()
+            if conn is None:
+                return []
+            rows = conn.execute(
+                "SELECT r.path, r.mime_type, r.width FROM media_renditions r"
+                " JOIN telegram_media m ON m.file_unique_id = r.file_unique_id"
+                " WHERE m.file_id = ? AND r.path IS NOT NULL",
+                (file_id,),
+            ).fetchall()
+        except sqlite3.Error:
+            return []
+        return [Rendition(os.path.join(RENDITIONS_DIR, path), mime, width) for path, mime, width in rows]
+
+
+metadata = MetadataReader(_sqlite_path(DB_URL))
+client = TelegramClient()
+
+
+def media_proxy(request: Request) -> Response:
+    file_id: str = request.path_params["file_id"]
+    width_hint = parse_width_hint(request.query_params.get("w"))
+    if width_hint:
+        rendition = choose_rendition(metadata.renditions(file_id), width_hint)
+        if rendition and os.path.exists(rendition.path):
+            return FileResponse(rendition.path, media_type=rendition.mime_type or "video/mp4", headers={"Cache-Control": CACHE_CONTROL})
+
+    mime, file_path, meta = metadata.lookup(file_id)
+    cached = answer_from_meta(request.method, request.headers.get("if-none-match"), meta, mime)
+    if cached is not None:
+        return cached
+
+    try:
+        tg_resp = open_upstream(client, file_id, file_path)
+    except MediaError as e:
+        return PlainTextResponse(e.detail, status_code=e.status_code)
+
+    return upstream_response(request.method, tg_resp, meta, mime)
+
+
+def healthz(request: Request) -> Response:
+    return PlainTextResponse("ok")
+
+
+app = Starlette(
+    routes=[
+        Route("/media/telegram/{file_id}", media_proxy, methods=["GET", "HEAD"]),
+        Route("/healthz", healthz, methods=["GET"]),
+    ]
+)
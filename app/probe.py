@@ -0,0 +1,208 @@
+from __future__ import annotations
+
+import argparse
+import datetime as dt
+import hashlib
+import shutil
+import struct
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import exists, func, or_, select, update
+from sqlalchemy.orm import Session
+
+from .database import SessionLocal, init_db, MediaMetadata, TelegramMedia
+from .media import iter_stream, open_upstream
+from .telegram_client import TelegramClient
+from .transcode import FFPROBE, probe as ffprobe
+
+
+# Background probe of original Telegram files.
+# Run with: python -m app.probe --workers 8   (e.g. from cron)
+# Downloads each file once, hashes it while streaming, sniffs the MIME type
+# and, when ffprobe is installed, reads dimensions and duration. Results go to
+# media_metadata and fill missing size/width/height/mime_type on
+# telegram_media. --verify re-downloads probed files and reports hash
+# mismatches.
+
+BATCH_SIZE = 100
+
+
+def sniff(head: bytes) -> Tuple[Optional[str], Optional[int], Optional[int]]:
+    """(mime_type, width, height) from the first bytes of a file."""
+    if head[:4] == b"GIF8" and len(head) >= 10:
+        width, height = struct.unpack("<HH", head[6:10])
+        return "image/gif", width, height
+    if head[:8] == b"\x89PNG\r\n\x1a\n" and len(head) >= 24:
+        width, height = struct.unpack(">II", head[16:24])
+        return "image/png", width, height
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp", None, None
+    if head[:4] == b"\x1a\x45\xdf\xa3":
+        return "video/webm", None, None
+    if head[4:8] == b"ftyp":
+        return ("video/quicktime" if head[8:12] == b"qt  " else "video/mp4"), None, None
+    return None, None, None
+
+
+def probe_file(client: TelegramClient, file_id: str) -> Dict[str, Any]:
+    digest = hashlib.sha256()
+    size = 0
+    head = b""
+    with tempfile.NamedTemporaryFile(prefix="probe-") as tmp:
+        for chunk in iter_stream(open_upstream(client, file_id)):
+            if len(head) < 64:
+                head += chunk[: 64 - len(head)]
+            digest.update(chunk)
+            size += len(chunk)
+            tmp.write(chunk)
+        tmp.flush()
+
+        mime, width, height = sniff(head)
+        result: Dict[str, Any] = {
+            "mime_type": mime,
+            "bytes": size,
+            "width": width,
+            "height": height,
+            "duration": None,
+            "sha256": digest.hexdigest(),
+        }
+        if shutil.which(FFPROBE):
+            try:
+                info = ffprobe(tmp.name)
+            except Exception:
+                info = {}
+            for key in ("width", "height", "duration"):
+                if info.get(key) is not None:
+                    result[key] = info[key]
+    return result
+
+
+def pending_media(db: Session, after_id: int, limit: int) -> List[Tuple[int, str, str]]:
+    """(id, file_id, file_unique_id) of unprobed media after ``after_id``."""
+    probed = exists().where(MediaMetadata.file_unique_id == TelegramMedia.file_unique_id)
+    stmt = (
+        select(TelegramMedia.id, TelegramMedia.file_id, TelegramMedia.file_unique_id)
+        .where(TelegramMedia.id > after_id, TelegramMedia.file_unique_id.is_not(None), ~probed)
+        .order_by(TelegramMedia.id)
+        .limit(limit)
+    )
+    return [tuple(row) for row in db.execute(stmt)]
+
+
+def store(db: Session, file_unique_id: str, result: Dict[str, Any]) -> None:
+    meta = db.execute(select(MediaMetadata).where(MediaMetadata.file_unique_id == file_unique_id)).scalar_one_or_none()
+    if meta is None:
+        meta = MediaMetadata(file_unique_id=file_unique_id)
+    for key, value in result.items():
+        setattr(meta, key, value)
+    meta.probed_at = dt.datetime.utcnow()
+    db.add(meta)
+    # Keep values reported by Telegram, only fill the gaps. Rows without a gap
+    # this probe can fill are left alone: touching telegram_media bumps the
+    # catalog version and with it every cached page.
+    fills = {
+        TelegramMedia.mime_type: result["mime_type"],
+        TelegramMedia.size: result["bytes"],
+        TelegramMedia.width: result["width"],
+        TelegramMedia.height: result["height"],
+    }
+    gaps = [column.is_(None) for column, value in fills.items() if value is not None]
+    ids = list(
+        db.execute(select(TelegramMedia.id).where(TelegramMedia.file_unique_id == file_unique_id, or_(*gaps))).scalars()
+    ) if gaps else []
+    if ids:
+        db.execute(
+            update(TelegramMedia)
+            .where(TelegramMedia.id.in_(ids))
+            .values({column: func.coalesce(column, value) for column, value in fills.items()})
+        )
+    db.commit()
+
+
+def _probe_all(jobs: List[Tuple[str, str]], workers: int):
+    client = TelegramClient()
+
+    def one(job: Tuple[str, str]):
+        file_id, file_unique_id = job
+        try:
+            return file_unique_id, probe_file(client, file_id), None
+        except Exception as e:
+            return file_unique_id, None, e
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        yield from pool.map(one, jobs)
+
+
+def run(workers: int = 4, limit: int = 1000) -> Dict[str, int]:
+    stats = {"probed": 0, "failed": 0}
+    db = SessionLocal()
+    try:
+        # Walk by id so rows that fail are not retried within the same run
+        after_id = 0
+        remaining = limit
+        while remaining > 0:
+            rows = pending_media(db, after_id, min(BATCH_SIZE, remaining))
+            if not rows:
+                break
+            after_id = rows[-1][0]
+            remaining -= len(rows)
+            jobs = list(dict((fuid, (fid, fuid)) for _, fid, fuid in rows).values())
+            for file_unique_id, result, error in _probe_all(jobs, workers):
+                if error is not None:
+                    stats["failed"] += 1
+                    continue
+                store(db, file_unique_id, result)
+                stats["probed"] += 1
+    finally:
+        db.close()
+    return stats
+
+
+def verify(workers: int = 4, limit: int = 1000) -> List[str]:
+    """Re-download probed files; returns file_unique_ids whose content changed."""
+    db = SessionLocal()
+    try:
+        stmt = (
+            select(TelegramMedia.file_id, MediaMetadata.file_unique_id, MediaMetadata.sha256)
+            .join(MediaMetadata, MediaMetadata.file_unique_id == TelegramMedia.file_unique_id)
+            .order_by(MediaMetadata.probed_at)
+            .limit(limit)
+        )
+        expected = {fuid: (fid, sha) for fid, fuid, sha in db.execute(stmt)}
+        mismatched = []
+        jobs = [(fid, fuid) for fuid, (fid, _) in expected.items()]
+        for file_unique_id, result, error in _probe_all(jobs, workers):
+            if error is not None:
+                continue
+            if result["sha256"] != expected[file_unique_id][1]:
+                mismatched.append(file_unique_id)
+            # Also bumps probed_at so the next run checks other files first
+            store(db, file_unique_id, result)
+        return mismatched
+    finally:
+        db.close()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Probe Telegram media and fill the metadata index")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--limit", type=int, default=1000, help="max files per run")
+    parser.add_argument("--verify", action="store_true", help="re-check hashes of already probed files")
+    args = parser.parse_args(argv)
+
+    init_db()
+    if args.verify:
+        mismatched = verify(workers=args.workers, limit=args.limit)
+        print(f"hash mismatches: {len(mismatched)}")
+        for file_unique_id in mismatched:
+            print(f"  {file_unique_id}")
+        return 1 if mismatched else 0
+    stats = run(workers=args.workers, limit=args.limit)
+    print(f"probed: {stats['probed']}, failed: {stats['failed']}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,241 @@
+from __future__ import annotations
+
+import os
+import re
+import secrets
+import sys
+import sysconfig
+import threading
+import time
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl
+
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .deps import is_admin
+
+
+# Opt-in profiling of a single request.
+# An admin adds "X-Profile: 1" or "?_profile=1" (with the usual basic auth) to
+# any request; the response carries X-Profile-Id and the report can be
+# downloaded from /admin/profiles/{id}. Sync endpoints, dependencies and
+# streamed bodies run in threadpool threads, which cProfile (current thread
+# only) would miss, so a sampler thread walks the stacks of every busy thread
+# instead. Other requests in flight on the same worker are sampled too; use
+# it on a quiet worker for clean numbers. Requests without the flag only pay
+# for a header/query check.
+
+DATA_DIR = os.getenv("APP_DATA_DIR", "/workspace/data")
+PROFILE_DIR = os.path.join(DATA_DIR, "profiles")
+SAMPLE_INTERVAL = float(os.getenv("APP_PROFILE_INTERVAL_MS", "2")) / 1000
+MAX_SECONDS = 60
+MAX_PROFILES = 50
+TOP_FUNCTIONS = 30
+
+QUERY_FLAG = ("_profile", "1")
+HEADER_FLAG = (b"x-profile", b"1")
+
+# A stack counts towards the first component with a frame anywhere in it
+COMPONENTS: Tuple[Tuple[str, Tuple[str, ...]], ...] = (
+    ("telegram", ("app/telegram_client.py", "requests/", "urllib3/")),
+    ("sqlalchemy", ("sqlalchemy/", "sqlite3/")),
+    ("jinja", ("jinja2/", "markupsafe/", "templates/")),
+)
+
+# Leaf frames of threads that are waiting for work, not doing it
+_IDLE_FILES = ("threading.py", "selectors.py", "queue.py", "asyncio/runners.py")
+
+_PROFILE_ID_RE = re.compile(r"^[0-9]{8}-[0-9]{6}-[0-9a-f]{6}$")
+_busy = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def _prefixes() -> Tuple[str, ...]:
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    paths = sysconfig.get_paths()
+    found = {base_dir, paths["purelib"], paths["platlib"], paths["stdlib"]}
+    return tuple(sorted((p.rstrip(os.sep) + os.sep for p in found if p), key=len, reverse=True))
+
+
+@lru_cache(maxsize=4096)
+def _short_path(filename: str) -> str:
+    for prefix in _prefixes():
+        if filename.startswith(prefix):
+            return filename[len(prefix):]
+    return filename
+
+
+def _label(frame) -> str:
+    code = frame.f_code
+    return f"{_short_path(code.co_filename)}:{getattr(code, 'co_qualname', code.co_name)}"
+
+
+def _stack(frame) -> Optional[Tuple[str, ...]]:
+    """Root-to-leaf labels, or None if the thread is idle."""
+    if _short_path(frame.f_code.co_filename).endswith(_IDLE_FILES):
+        return None
+    labels = []
+    while frame is not None:
+        labels.append(_label(frame))
+        frame = frame.f_back
+    labels.reverse()
+    return tuple(labels)
+
+
+class Sampler(threading.Thread):
+    def __init__(self, interval: float = SAMPLE_INTERVAL) -> None:
+        super().__init__(name="profile-sampler", daemon=True)
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.ticks = 0
+        self._halt = threading.Event()
+
+    def run(self) -> None:
+        own = threading.get_ident()
+        deadline = time.monotonic() + MAX_SECONDS
+        while not self._halt.wait(self.interval) and time.monotonic() < deadline:
+            self.ticks += 1
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = _stack(frame)
+                if stack is not None:
+                    self.stacks[stack] += 1
+
+    def stop(self) -> None:
+        self._halt.set()
+        self.join()
+
+
+def component_of(stack: Tuple[str, ...]) -> str:
+    for name, markers in COMPONENTS:
+        if any(marker in label for label in stack for marker in markers):
+            return name
+    return "other"
+
+
+def render_report(title: str, elapsed: float, sampler: Sampler) -> str:
+    total = sum(sampler.stacks.values())
+    lines = [
+        title,
+        f"wall time {elapsed * 1000:.1f} ms, {sampler.ticks} ticks at {sampler.interval * 1000:g} ms, {total} busy thread samples",
+        "",
+    ]
+    if not total:
+        lines.append("no samples (request finished faster than the sampling interval)")
+        return "\n".join(lines) + "\n"
+
+    by_component: Counter = Counter()
+    inclusive: Counter = Counter()
+    own: Counter = Counter()
+    for stack, count in sampler.stacks.items():
+        by_component[component_of(stack)] += count
+        for label in set(stack):
+            inclusive[label] += count
+        own[stack[-1]] += count
+
+    lines.append("by component")
+    for name, count in by_component.most_common():
+        lines.append(f"  {name:<12} {count * 100 / total:6.1f}%  ~{elapsed * 1000 * count / total:8.1f} ms")
+    for heading, counter in (("top functions (inclusive)", inclusive), ("top functions (self)", own)):
+        lines += ["", heading]
+        for label, count in counter.most_common(TOP_FUNCTIONS):
+            lines.append(f"  {count * 100 / total:6.1f}%  {count:6d}  {label}")
+    return "\n".join(lines) + "\n"
+
+
+def render_folded(sampler: Sampler) -> str:
+    """Collapsed stacks, the input format of flamegraph.pl / speedscope."""
+    return "".join(f"{';'.join(stack)} {count}\n" for stack, count in sampler.stacks.most_common())
+
+
+def new_profile_id() -> str:
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{secrets.token_hex(3)}"
+
+
+def profile_path(profile_id: str, fmt: str = "txt") -> Optional[str]:
+    if not _PROFILE_ID_RE.match(profile_id) or fmt not in ("txt", "folded"):
+        return None
+    path = os.path.join(PROFILE_DIR, f"{profile_id}.{fmt}")
+    return path if os.path.exists(path) else None
+
+
+def list_profiles() -> List[Dict[str, str]]:
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    profiles = []
+    for name in sorted(os.listdir(PROFILE_DIR), reverse=True):
+        if not name.endswith(".txt"):
+            continue
+        with open(os.path.join(PROFILE_DIR, name), encoding="utf-8") as f:
+            title = f.readline().strip()
+        profiles.append({"id": name[:-4], "request": title})
+    return profiles
+
+
+def save_profile(profile_id: str, title: str, elapsed: float, sampler: Sampler) -> None:
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    for fmt, body in (("txt", render_report(title, elapsed, sampler)), ("folded", render_folded(sampler))):
+        with open(os.path.join(PROFILE_DIR, f"{profile_id}.{fmt}"), "w", encoding="utf-8") as f:
+            f.write(body)
+    # Ids sort by time; drop the oldest beyond the limit
+    for old in list_profiles()[MAX_PROFILES:]:
+        for fmt in ("txt", "folded"):
+            try:
+                os.remove(os.path.join(PROFILE_DIR, f"{old['id']}.{fmt}"))
+            except OSError:
+                pass
+
+
+def _requested(scope: Scope) -> bool:
+    query = scope.get("query_string", b"")
+    if query and QUERY_FLAG in parse_qsl(query.decode("latin-1")):
+        return True
+    return any((name, value.strip()) == HEADER_FLAG for name, value in scope.get("headers", ()))
+
+
+class ProfilingMiddleware:
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not _requested(scope) or not is_admin(Request(scope)):
+            await self.app(scope, receive, send)
+            return
+        # One profile per worker at a time, otherwise the samples would mix
+        if not _busy.acquire(blocking=False):
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = new_profile_id()
+        status: List[int] = []
+
+        async def send_with_id(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                status.append(message["status"])
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-profile-id", profile_id.encode()),
+                    (b"x-profile-url", f"/admin/profiles/{profile_id}".encode()),
+                ]
+            await send(message)
+
+        query = scope.get("query_string", b"").decode("latin-1")
+        title = f"{scope['method']} {scope['path']}{'?' + query if query else ''}"
+        sampler = Sampler()
+        started = time.perf_counter()
+        sampler.start()
+        try:
+            # Covers streamed bodies too: the app returns after the last chunk is sent
+            await self.app(scope, receive, send_with_id)
+        finally:
+            elapsed = time.perf_counter() - started
+            try:
+                await run_in_threadpool(sampler.stop)
+                title += f" -> {status[0] if status else 'no response'}"
+                await run_in_threadpool(save_profile, profile_id, title, elapsed, sampler)
+            finally:
+                _busy.release()
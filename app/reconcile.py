@@ -0,0 +1,304 @@
+from __future__ import annotations
+
+import argparse
+import datetime as dt
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import delete, exists, select, update
+from sqlalchemy.orm import Session, aliased
+
+from .database import RENDITIONS_DIR, SessionLocal, engine, init_db, Gift, MediaMetadata, MediaRendition, TelegramMedia
+from .ingest import purge_processed
+from .media import MediaError, resolve_file_path
+from .search import merge as merge_search_index
+from .telegram_client import TelegramClient
+
+
+# Garbage collection and orphan reconciliation.
+# Run with: python -m app.reconcile   (e.g. nightly from cron)
+# Every step walks its table by id in small batches, each batch in its own
+# short transaction with a pause in between, so the app's writers never wait
+# long for the SQLite lock. Files are removed only after the rows pointing to
+# them are committed.
+#
+# Steps:
+#   - renditions and probed metadata of media that no telegram_media row uses
+#   - rendition files on disk that no media_renditions row points to
+#   - file_path values not checked for a while: refreshed via getFile, or
+#     cleared when Telegram no longer knows the file
+#   - processed telegram_updates journal rows older than a week
+#   - with --prune-duplicates: older telegram_media rows of the same
+#     file_unique_id that no gift references
+#   - compaction: incremental vacuum, bounded FTS merge, PRAGMA optimize;
+#     --vacuum runs one full VACUUM (long lock, maintenance window only) and
+#     switches the database to incremental auto-vacuum for later runs
+
+BATCH_SIZE = 200
+PAUSE = 0.05
+# Rendition files younger than this may belong to a transcode still in progress
+ORPHAN_GRACE = 60 * 60
+PATH_MAX_AGE = dt.timedelta(hours=24)
+VACUUM_STEP_PAGES = 1000
+VACUUM_MAX_STEPS = 100
+FTS_MERGE_PAGES = 500
+
+
+def _batches(db: Session, stmt_for, batch_size: int) -> Iterator[List[Tuple]]:
+    """Keyset pagination: ``stmt_for(after_id)`` must select the id first and order by it."""
+    after_id = 0
+    while True:
+        rows = [tuple(row) for row in db.execute(stmt_for(after_id).limit(batch_size))]
+        if not rows:
+            return
+        yield rows
+        after_id = rows[-1][0]
+        time.sleep(PAUSE)
+
+
+def _remove(path: str) -> int:
+    try:
+        size = os.path.getsize(path)
+        os.remove(path)
+    except OSError:
+        return 0
+    return size
+
+
+def prune_duplicate_media(db: Session, batch_size: int = BATCH_SIZE) -> int:
+    newer = aliased(TelegramMedia)
+    has_newer = exists().where(newer.file_unique_id == TelegramMedia.file_unique_id, newer.id > TelegramMedia.id)
+    used_by_gift = exists().where(Gift.telegram_file_id == TelegramMedia.file_id)
+    deleted = 0
+    for rows in _batches(
+        db,
+        lambda after_id: select(TelegramMedia.id)
+        .where(TelegramMedia.id > after_id, TelegramMedia.file_unique_id.is_not(None), has_newer, ~used_by_gift)
+        .order_by(TelegramMedia.id),
+        batch_size,
+    ):
+        db.execute(delete(TelegramMedia).where(TelegramMedia.id.in_([r[0] for r in rows])))
+        db.commit()
+        deleted += len(rows)
+    return deleted
+
+
+def evict_renditions(db: Session, batch_size: int = BATCH_SIZE) -> Dict[str, int]:
+    in_use = exists().where(TelegramMedia.file_unique_id == MediaRendition.file_unique_id)
+    stats = {"rows": 0, "files": 0, "bytes": 0}
+    for rows in _batches(
+        db,
+        lambda after_id: select(MediaRendition.id, MediaRendition.path)
+        .where(MediaRendition.id > after_id, ~in_use)
+        .order_by(MediaRendition.id),
+        batch_size,
+    ):
+        # Check again in the DELETE: the file may have been ingested since the
+        # select, and only the rows really deleted may lose their files
+        deleted = db.execute(
+            delete(MediaRendition)
+            .where(MediaRendition.id.in_([r[0] for r in rows]), ~in_use)
+            .returning(MediaRendition.id, MediaRendition.path)
+        ).all()
+        db.commit()
+        stats["rows"] += len(deleted)
+        for _, path in deleted:
+            if path:
+                size = _remove(os.path.join(RENDITIONS_DIR, path))
+                if size:
+                    stats["files"] += 1
+                    stats["bytes"] += size
+    return stats
+
+
+def evict_metadata(db: Session, batch_size: int = BATCH_SIZE) -> int:
+    in_use = exists().where(TelegramMedia.file_unique_id == MediaMetadata.file_unique_id)
+    deleted = 0
+    for rows in _batches(
+        db,
+        lambda after_id: select(MediaMetadata.id).where(MediaMetadata.id > after_id, ~in_use).order_by(MediaMetadata.id),
+        batch_size,
+    ):
+        result = db.execute(delete(MediaMetadata).where(MediaMetadata.id.in_([r[0] for r in rows]), ~in_use))
+        db.commit()
+        deleted += result.rowcount
+    return deleted
+
+
+def _rendition_files() -> Iterator[str]:
+    """Paths relative to RENDITIONS_DIR, as stored in media_renditions.path."""
+    if not os.path.isdir(RENDITIONS_DIR):
+        return
+    for label in os.scandir(RENDITIONS_DIR):
+        if not label.is_dir():
+            continue
+        for entry in os.scandir(label.path):
+            if entry.is_file():
+                yield os.path.join(label.name, entry.name)
+
+
+def sweep_orphan_files(db: Session, batch_size: int = BATCH_SIZE) -> Dict[str, int]:
+    stats = {"files": 0, "bytes": 0}
+    cutoff = time.time() - ORPHAN_GRACE
+    chunk: List[str] = []
+
+    def flush() -> None:
+        known = set(db.execute(select(MediaRendition.path).where(MediaRendition.path.in_(chunk))).scalars())
+        db.rollback()  # end the read transaction
+        for rel_path in chunk:
+            path = os.path.join(RENDITIONS_DIR, rel_path)
+            if rel_path in known:
+                continue
+            try:
+                if os.path.getmtime(path) > cutoff:
+                    continue
+            except OSError:
+                continue
+            size = _remove(path)
+            if size:
+                stats["files"] += 1
+                stats["bytes"] += size
+        chunk.clear()
+
+    for rel_path in _rendition_files():
+        chunk.append(rel_path)
+        if len(chunk) >= batch_size:
+            flush()
+    if chunk:
+        flush()
+    return stats
+
+
+def _check_path(client: TelegramClient, file_id: str) -> Tuple[str, Optional[str]]:
+    """("ok", path) | ("gone", None) | ("error", None)"""
+    try:
+        return "ok", resolve_file_path(client, file_id)
+    except MediaError as e:
+        return ("gone" if e.status_code == 404 else "error"), None
+    except Exception:
+        return "error", None
+
+
+def refresh_file_paths(db: Session, limit: int = 200, workers: int = 4, max_age: dt.timedelta = PATH_MAX_AGE) -> Dict[str, int]:
+    client = TelegramClient()
+    stats = {"checked": 0, "refreshed": 0, "cleared": 0, "failed": 0}
+    due = dt.datetime.utcnow() - max_age
+    stmt = (
+        select(TelegramMedia.id, TelegramMedia.file_id, TelegramMedia.file_path)
+        .where(
+            TelegramMedia.file_path.is_not(None),
+            (TelegramMedia.file_path_checked_at.is_(None)) | (TelegramMedia.file_path_checked_at < due),
+        )
+        .order_by(TelegramMedia.file_path_checked_at.asc().nulls_first(), TelegramMedia.id)
+        .limit(limit)
+    )
+    rows = list(db.execute(stmt))
+    db.rollback()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for start in range(0, len(rows), BATCH_SIZE):
+            batch = rows[start:start + BATCH_SIZE]
+            results = list(pool.map(lambda row: _check_path(client, row.file_id), batch))
+            now = dt.datetime.utcnow()
+            checked_only = []
+            for row, (outcome, path) in zip(batch, results):
+                if outcome == "error":
+                    stats["failed"] += 1
+                    continue
+                stats["checked"] += 1
+                if outcome == "ok" and path == row.file_path:
+                    checked_only.append(row.id)
+                    continue
+                stats["refreshed" if outcome == "ok" else "cleared"] += 1
+                db.execute(update(TelegramMedia).where(TelegramMedia.id == row.id).values(file_path=path, file_path_checked_at=now))
+            if checked_only:
+                # Bookkeeping only: bypass the session events so the catalog
+                # version (and every cached page) is not bumped for it
+                db.connection().execute(
+                    update(TelegramMedia).where(TelegramMedia.id.in_(checked_only)).values(file_path_checked_at=now)
+                )
+            db.commit()
+            time.sleep(PAUSE)
+    return stats
+
+
+def _pragma(conn, name: str) -> int:
+    return int(conn.exec_driver_sql(f"PRAGMA {name}").scalar() or 0)
+
+
+def compact(full_vacuum: bool = False) -> Dict[str, object]:
+    if engine.dialect.name != "sqlite":
+        return {"skipped": "not sqlite"}
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        page_size = _pragma(conn, "page_size")
+        pages_before = _pragma(conn, "page_count")
+        if full_vacuum:
+            # auto_vacuum can only change with a VACUUM; later runs go incremental
+            conn.exec_driver_sql("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.exec_driver_sql("VACUUM")
+        elif _pragma(conn, "auto_vacuum") == 2:
+            for _ in range(VACUUM_MAX_STEPS):
+                if not _pragma(conn, "freelist_count"):
+                    break
+                # sqlite3's execute() steps this pragma once, i.e. frees a single
+                # page; executescript() runs it to completion
+                conn.connection.driver_connection.executescript(f"PRAGMA incremental_vacuum({VACUUM_STEP_PAGES})")
+                time.sleep(PAUSE)
+        merge_search_index(conn, FTS_MERGE_PAGES)
+        conn.exec_driver_sql("PRAGMA optimize")
+        pages_after = _pragma(conn, "page_count")
+        return {
+            "reclaimed_bytes": max(pages_before - pages_after, 0) * page_size,
+            "free_bytes": _pragma(conn, "freelist_count") * page_size,
+            "incremental": _pragma(conn, "auto_vacuum") == 2,
+        }
+
+
+def run(
+    prune_duplicates: bool = False,
+    refresh_limit: int = 200,
+    workers: int = 4,
+    full_vacuum: bool = False,
+) -> Dict[str, object]:
+    report: Dict[str, object] = {}
+    db = SessionLocal()
+    try:
+        if prune_duplicates:
+            report["duplicate_media_rows"] = prune_duplicate_media(db)
+        report["renditions"] = evict_renditions(db)
+        report["metadata_rows"] = evict_metadata(db)
+        report["orphan_files"] = sweep_orphan_files(db)
+        report["journal_rows"] = purge_processed(db)
+        if refresh_limit:
+            report["file_paths"] = refresh_file_paths(db, limit=refresh_limit, workers=workers)
+    finally:
+        db.close()
+    report["database"] = compact(full_vacuum)
+    return report
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Reclaim unreferenced media, refresh stale file paths and compact the database")
+    parser.add_argument("--prune-duplicates", action="store_true", help="delete older telegram_media rows of the same file that no gift uses")
+    parser.add_argument("--refresh-limit", type=int, default=200, help="max file paths to re-check via getFile (0 to skip)")
+    parser.add_argument("--workers", type=int, default=4, help="parallel getFile calls")
+    parser.add_argument("--vacuum", action="store_true", help="run a full VACUUM (locks the database while it runs)")
+    args = parser.parse_args(argv)
+
+    init_db()
+    report = run(
+        prune_duplicates=args.prune_duplicates,
+        refresh_limit=args.refresh_limit,
+        workers=args.workers,
+        full_vacuum=args.vacuum,
+    )
+    for key, value in report.items():
+        if isinstance(value, dict):
+            value = ", ".join(f"{k}={v}" for k, v in value.items())
+        print(f"{key}: {value}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
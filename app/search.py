@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+import re
+from typing import List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+
+# Full-text search over gifts (title, description) and Telegram media (caption).
+# Uses SQLite FTS5 external-content tables; triggers on the source tables keep
+# the index in sync for every write path (admin CRUD, ingestion, bulk
+# statements). Other databases fall back to LIKE matching.
+
+KINDS = ("gift", "media")
+FTS_TABLES = ("gifts_fts", "telegram_media_fts")
+
+_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS gifts_fts USING fts5(
+        title, description,
+        content='gifts', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS telegram_media_fts USING fts5(
+        caption,
+        content='telegram_media', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS gifts_fts_ai AFTER INSERT ON gifts BEGIN
+        INSERT INTO gifts_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS gifts_fts_ad AFTER DELETE ON gifts BEGIN
+        INSERT INTO gifts_fts(gifts_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS gifts_fts_au AFTER UPDATE OF title, description ON gifts BEGIN
+        INSERT INTO gifts_fts(gifts_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO gifts_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS telegram_media_fts_ai AFTER INSERT ON telegram_media BEGIN
+        INSERT INTO telegram_media_fts(rowid, caption) VALUES (new.id, new.caption);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS telegram_media_fts_ad AFTER DELETE ON telegram_media BEGIN
+        INSERT INTO telegram_media_fts(telegram_media_fts, rowid, caption) VALUES ('delete', old.id, old.caption);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS telegram_media_fts_au AFTER UPDATE OF caption ON telegram_media BEGIN
+        INSERT INTO telegram_media_fts(telegram_media_fts, rowid, caption) VALUES ('delete', old.id, old.caption);
+        INSERT INTO telegram_media_fts(rowid, caption) VALUES (new.id, new.caption);
+    END
+    """,
+]
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def is_supported(engine: Engine) -> bool:
+    return engine.dialect.name == "sqlite"
+
+
+def init_search(engine: Engine) -> None:
+    """Create the FTS tables and triggers; index existing rows on first run."""
+    if not is_supported(engine):
+        return
+    with engine.begin() as conn:
+        existed = conn.execute(text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'gifts_fts'")).first()
+        for stmt in _DDL:
+            conn.exec_driver_sql(stmt)
+        if not existed:
+            rebuild(conn)
+
+
+def rebuild(conn) -> None:
+    for table in FTS_TABLES:
+        conn.exec_driver_sql(f"INSERT INTO {table}({table}) VALUES ('rebuild')")
+
+
+def merge(conn, pages: int = 500) -> None:
+    """Merge index segments, writing at most ``pages`` pages per table.
+
+    Unlike 'optimize' the amount of work is bounded, so it can run next to
+    live traffic.
+    """
+    for table in FTS_TABLES:
+        conn.exec_driver_sql(f"INSERT INTO {table}({table}, rank) VALUES ('merge', {int(pages)})")
+
+
+def build_match(query: str) -> Optional[str]:
+    """Turn free user input into a safe FTS5 MATCH expression (AND of prefix terms)."""
+    tokens = _TOKEN_RE.findall(query or "")
+    if not tokens:
+        return None
+    return " ".join(f'"{t}"*' for t in tokens[:16])
+
+
+def search(db: Session, query: str, kind: Optional[str] = None, limit: int = 20, offset: int = 0) -> List[Tuple[str, int]]:
+    """Return ranked ``(kind, id)`` pairs, best match first."""
+    match = build_match(query)
+    if match is None:
+        return []
+    kinds = (kind,) if kind else KINDS
+    if not is_supported(db.get_bind()):
+        return _search_like(db, query, kinds, limit, offset)
+
+    parts = []
+    if "gift" in kinds:
+        # Title hits weigh more than description hits
+        parts.append("SELECT 'gift' AS kind, rowid AS id, bm25(gifts_fts, 10.0, 1.0) AS rank FROM gifts_fts WHERE gifts_fts MATCH :q")
+    if "media" in kinds:
+        parts.append("SELECT 'media' AS kind, rowid AS id, bm25(telegram_media_fts) AS rank FROM telegram_media_fts WHERE telegram_media_fts MATCH :q")
+    sql = " UNION ALL ".join(parts) + " ORDER BY rank LIMIT :limit OFFSET :offset"
+    rows = db.execute(text(sql), {"q": match, "limit": limit, "offset": offset})
+    return [(r.kind, r.id) for r in rows]
+
+
+def _search_like(db: Session, query: str, kinds, limit: int, offset: int) -> List[Tuple[str, int]]:
+    pattern = f"%{query.strip()}%"
+    parts = []
+    if "gift" in kinds:
+        parts.append("SELECT 'gift' AS kind, id, created_at FROM gifts WHERE title LIKE :p OR description LIKE :p")
+    if "media" in kinds:
+        parts.append("SELECT 'media' AS kind, id, created_at FROM telegram_media WHERE caption LIKE :p")
+    sql = " UNION ALL ".join(parts) + " ORDER BY created_at DESC LIMIT :limit OFFSET :offset"
+    rows = db.execute(text(sql), {"p": pattern, "limit": limit, "offset": offset})
+    return [(r.kind, r.id) for r in rows]
@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+
+# Worker cold-start report.
+# Run with: python -m app.startup_report [--budget-ms 1500] [--top 15]
+# Spawns a fresh interpreter with -X importtime, imports app.main, runs
+# init_db() and loads the main templates, then prints where the time went.
+# With --budget-ms the exit status is 1 when the total is over budget, so it
+# can gate a deploy.
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_CHILD = """
+import json, sys, time
+t0 = time.perf_counter()
+import app.main as main
+t1 = time.perf_counter()
+main.init_db()
+t2 = time.perf_counter()
+for name in ("index.html", "_media_cards.html", "admin/gifts_list.html"):
+    main.templates.get_template(name)
+t3 = time.perf_counter()
+print(json.dumps({"import": t1 - t0, "init_db": t2 - t1, "templates": t3 - t2}))
+"""
+
+_LINE_RE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+
+def measure() -> Tuple[Dict[str, float], List[Tuple[str, int]]]:
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _CHILD],
+        cwd=BASE_DIR, capture_output=True, text=True, check=True,
+    )
+    phases = json.loads(proc.stdout.strip().splitlines()[-1])
+    # Self time per top-level package, in microseconds
+    by_package: Dict[str, int] = defaultdict(int)
+    for line in proc.stderr.splitlines():
+        m = _LINE_RE.match(line)
+        if m:
+            by_package[m.group(4).split(".")[0]] += int(m.group(1))
+    return phases, sorted(by_package.items(), key=lambda kv: -kv[1])
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Report worker cold-start time")
+    parser.add_argument("--budget-ms", type=float, default=None, help="fail if total startup exceeds this")
+    parser.add_argument("--top", type=int, default=15, help="number of packages to list")
+    args = parser.parse_args(argv)
+
+    phases, packages = measure()
+    total_ms = sum(phases.values()) * 1000
+    print("phase            ms")
+    for name, seconds in phases.items():
+        print(f"  {name:<12} {seconds * 1000:8.1f}")
+    print(f"  {'total':<12} {total_ms:8.1f}")
+    print()
+    print("imports by package (self time)")
+    for name, micros in packages[: args.top]:
+        print(f"  {name:<24} {micros / 1000:8.1f}")
+
+    if args.budget_ms is not None and total_ms > args.budget_ms:
+        print(f"\nover budget: {total_ms:.1f} ms > {args.budget_ms:.1f} ms")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
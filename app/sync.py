@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Any, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from .database import Gift, GiftChange, MediaChange, TelegramMedia
+
+
+# Delta sync for catalog clients.
+#
+# A cursor is the last seq a client has seen in gift_changes / media_changes.
+# Triggers move a gift or media row to a new seq on every insert, update and
+# delete (app.reconcile pruning duplicates or rewriting file_path included),
+# so updates and deletions share one sequence that only grows in commit
+# order: an id that is deleted and then reused shows up once, in its latest
+# state, and a row committed late is never behind a cursor handed out earlier.
+
+MAX_PAGE = 500
+
+
+class CursorError(ValueError):
+    pass
+
+
+def parse_cursor(raw: Optional[str]) -> int:
+    if not raw:
+        return 0
+    try:
+        seq = int(raw)
+    except ValueError:
+        # Includes the "<ts>.<gift id>.<tombstone id>" cursors of schema 3
+        raise CursorError("Malformed cursor, sync again without since")
+    if seq < 0:
+        raise CursorError("Malformed cursor, sync again without since")
+    return seq
+
+
+@dataclass
+class Delta:
+    cursor: int
+    updated: List[Any]
+    deleted: List[int]
+    has_more: bool
+
+
+def _changes(db: Session, log_key, model, since: int, limit: int) -> Delta:
+    log = log_key.class_
+    # One statement, so the change rows and the objects come from one snapshot
+    stmt = (
+        select(log.seq, log_key, log.deleted, model)
+        .outerjoin(model, model.id == log_key)
+        .where(log.seq > since)
+        .order_by(log.seq)
+        .limit(limit + 1)
+    )
+    rows = db.execute(stmt).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return Delta(
+        cursor=rows[-1].seq if rows else since,
+        updated=[row[3] for row in rows if not row.deleted and row[3] is not None],
+        deleted=[row[1] for row in rows if row.deleted or row[3] is None],
+        has_more=has_more,
+    )
+
+
+def gift_changes(db: Session, since: int, limit: int = MAX_PAGE) -> Delta:
+    return _changes(db, GiftChange.gift_id, Gift, since, limit)
+
+
+def media_changes(db: Session, since: int, limit: int = MAX_PAGE) -> Delta:
+    return _changes(db, MediaChange.media_id, TelegramMedia, since, limit)
@@ -3,9 +3,8 @@ from __future__ import annotations
 import os
 from typing import Any, Dict, List, Optional, Tuple
 
-import requests
-
 
+# requests (and certifi) is imported on first use to keep worker startup fast
 class TelegramClient:
     def __init__(self, bot_token: Optional[str] = None) -> None:
         self.bot_token = bot_token or os.getenv("TELEGRAM_BOT_TOKEN") or "8494126901:AAE0fbTFsQosqG1YpoGjx9SkIM41PzB64RQ"
@@ -13,6 +12,8 @@ class TelegramClient:
         self.file_base = f"https://api.telegram.org/file/bot{self.bot_token}"
 
     def get_updates(self, offset: Optional[int] = None, timeout: int = 0) -> Dict[str, Any]:
+        import requests
+
         params: Dict[str, Any] = {}
         if offset is not None:
             params["offset"] = int(offset)
@@ -23,6 +24,8 @@ class TelegramClient:
         return resp.json()
 
     def get_file(self, file_id: str) -> Dict[str, Any]:
+        import requests
+
         resp = requests.get(f"{self.base}/getFile", params={"file_id": file_id}, timeout=30)
         resp.raise_for_status()
         return resp.json()
@@ -31,6 +34,8 @@ class TelegramClient:
         return f"{self.file_base}/{file_path}"
 
     def send_animation(self, chat_id_or_username: str | int, animation: str, caption: Optional[str] = None) -> Dict[str, Any]:
+        import requests
+
         data: Dict[str, Any] = {
             "chat_id": chat_id_or_username,
             "animation": animation,
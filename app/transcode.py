@@ -0,0 +1,224 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+
+from .database import RENDITIONS_DIR, SessionLocal, init_db, MediaRendition, TelegramMedia
+from .media import iter_stream, open_upstream
+from .telegram_client import TelegramClient
+
+
+# Offline transcoding of Telegram animations into smaller renditions.
+# Run with: python -m app.transcode --workers 4
+# Each worker process downloads one source, encodes every profile with the
+# locally installed ffmpeg and probes the result; the parent process is the
+# only DB writer. A rendition that would not save bytes (source already small
+# enough, or the encode came out larger) is recorded with path=NULL so it is
+# not retried on every run. Failures (download, ffmpeg errors and timeouts,
+# crashed workers) are not recorded at all, so the next run tries again.
+
+FFMPEG = os.getenv("APP_FFMPEG", "ffmpeg")
+FFPROBE = os.getenv("APP_FFPROBE", "ffprobe")
+
+# label -> max width in pixels
+PROFILES: Dict[str, int] = {
+    "small": 360,
+    "medium": 720,
+}
+
+ENCODE_TIMEOUT = 300
+
+
+def encoder_available() -> bool:
+    return shutil.which(FFMPEG) is not None and shutil.which(FFPROBE) is not None
+
+
+def probe(path: str) -> Dict[str, Any]:
+    out = subprocess.run(
+        [FFPROBE, "-v", "error", "-select_streams", "v:0",
+         "-show_entries", "stream=codec_name,width,height:format=duration",
+         "-of", "json", path],
+        check=True, capture_output=True, timeout=60,
+    ).stdout
+    info = json.loads(out or b"{}")
+    stream = (info.get("streams") or [{}])[0]
+    duration = (info.get("format") or {}).get("duration")
+    return {
+        "codec": stream.get("codec_name"),
+        "width": stream.get("width"),
+        "height": stream.get("height"),
+        "duration": float(duration) if duration not in (None, "N/A") else None,
+    }
+
+
+def encode(src: str, dst: str, max_width: int) -> None:
+    # H.264 MP4 without audio plays inline everywhere; -2 keeps the height even
+    subprocess.run(
+        [FFMPEG, "-y", "-v", "error", "-i", src,
+         "-vf", f"scale='min({max_width},iw)':-2",
+         "-c:v", "libx264", "-preset", "veryfast", "-crf", "28", "-pix_fmt", "yuv420p",
+         "-an", "-movflags", "+faststart", "-f", "mp4", dst],
+        check=True, capture_output=True, timeout=ENCODE_TIMEOUT,
+    )
+
+
+def transcode_job(file_id: str, file_unique_id: str, bot_token: str, profiles: Dict[str, int], out_dir: str) -> List[Dict[str, Any]]:
+    """Worker entry point: returns one result dict per profile label.
+
+    Results with "final" set are outcomes worth storing; the others carry the
+    error of an attempt that should be repeated.
+    """
+    results: List[Dict[str, Any]] = []
+    with tempfile.TemporaryDirectory(prefix="transcode-") as tmp:
+        src = os.path.join(tmp, "source")
+        try:
+            resp = open_upstream(TelegramClient(bot_token), file_id)
+            with open(src, "wb") as f:
+                for chunk in iter_stream(resp):
+                    f.write(chunk)
+            src_bytes = os.path.getsize(src)
+            src_width = probe(src)["width"]
+        except Exception as e:
+            return [{"label": label, "path": None, "error": f"source: {e}"} for label in profiles]
+
+        for label, max_width in profiles.items():
+            result: Dict[str, Any] = {"label": label, "path": None}
+            results.append(result)
+            if src_width and src_width <= max_width:
+                result.update(error="source is already small enough", final=True)
+                continue
+            rel_path = os.path.join(label, f"{file_unique_id}.mp4")
+            dst = os.path.join(out_dir, rel_path)
+            tmp_dst = os.path.join(tmp, f"{label}.mp4")
+            try:
+                encode(src, tmp_dst, max_width)
+                size = os.path.getsize(tmp_dst)
+                if size >= src_bytes:
+                    result.update(error="rendition is not smaller than the source", final=True)
+                    continue
+                meta = probe(tmp_dst)
+                os.makedirs(os.path.dirname(dst), exist_ok=True)
+                shutil.move(tmp_dst, dst)
+            except Exception as e:
+                result["error"] = str(e)
+                continue
+            result.update(meta, path=rel_path, bytes=size, mime_type="video/mp4", final=True)
+    return results
+
+
+def pending_media(db: Session, limit: int, profiles: Dict[str, int]) -> List[Tuple[str, str, Dict[str, int]]]:
+    """(file_id, file_unique_id, profiles without a stored outcome) triples."""
+    stored = (
+        select(func.count())
+        .where(MediaRendition.file_unique_id == TelegramMedia.file_unique_id, MediaRendition.label.in_(list(profiles)))
+        .scalar_subquery()
+    )
+    stmt = (
+        select(TelegramMedia.file_id, TelegramMedia.file_unique_id)
+        .where(TelegramMedia.file_unique_id.is_not(None), stored < len(profiles))
+        .order_by(TelegramMedia.id.desc())
+        .limit(limit)
+    )
+    rows = list(db.execute(stmt))
+    labels: Dict[str, set] = {}
+    if rows:
+        stmt = select(MediaRendition.file_unique_id, MediaRendition.label).where(
+            MediaRendition.file_unique_id.in_({r.file_unique_id for r in rows})
+        )
+        for file_unique_id, label in db.execute(stmt):
+            labels.setdefault(file_unique_id, set()).add(label)
+    seen = set()
+    pending = []
+    for file_id, file_unique_id in rows:
+        if file_unique_id not in seen:
+            seen.add(file_unique_id)
+            done = labels.get(file_unique_id, set())
+            pending.append((file_id, file_unique_id, {k: v for k, v in profiles.items() if k not in done}))
+    return pending
+
+
+def store_results(db: Session, file_unique_id: str, results: List[Dict[str, Any]]) -> None:
+    results = [r for r in results if r.get("final")]
+    if not results:
+        return
+    db.execute(
+        delete(MediaRendition).where(
+            MediaRendition.file_unique_id == file_unique_id,
+            MediaRendition.label.in_([r["label"] for r in results]),
+        )
+    )
+    for r in results:
+        db.add(
+            MediaRendition(
+                file_unique_id=file_unique_id,
+                label=r["label"],
+                path=r.get("path"),
+                codec=r.get("codec"),
+                mime_type=r.get("mime_type"),
+                bytes=r.get("bytes"),
+                width=r.get("width"),
+                height=r.get("height"),
+                duration=r.get("duration"),
+            )
+        )
+    db.commit()
+
+
+def run(workers: int = 2, limit: int = 100, profiles: Optional[Dict[str, int]] = None) -> Dict[str, int]:
+    profiles = profiles or PROFILES
+    bot_token = TelegramClient().bot_token
+    stats = {"media": 0, "renditions": 0, "skipped": 0, "failed": 0}
+    db = SessionLocal()
+    try:
+        jobs = pending_media(db, limit, profiles)
+        if not jobs:
+            return stats
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                pool.submit(transcode_job, file_id, file_unique_id, bot_token, missing, RENDITIONS_DIR): (file_unique_id, missing)
+                for file_id, file_unique_id, missing in jobs
+            }
+            for future in as_completed(futures):
+                file_unique_id, missing = futures[future]
+                try:
+                    results = future.result()
+                except Exception as e:
+                    results = [{"label": label, "path": None, "error": str(e)} for label in missing]
+                store_results(db, file_unique_id, results)
+                stats["media"] += 1
+                for r in results:
+                    if not r.get("final"):
+                        stats["failed"] += 1
+                    else:
+                        stats["renditions" if r.get("path") else "skipped"] += 1
+    finally:
+        db.close()
+    return stats
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Transcode Telegram animations into smaller renditions")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--limit", type=int, default=100, help="max media items per run")
+    args = parser.parse_args(argv)
+
+    if not encoder_available():
+        print(f"ffmpeg/ffprobe not found (APP_FFMPEG={FFMPEG}, APP_FFPROBE={FFPROBE})")
+        return 1
+    init_db()
+    stats = run(workers=args.workers, limit=args.limit)
+    print(", ".join(f"{k}: {v}" for k, v in stats.items()))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
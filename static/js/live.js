@@ -0,0 +1,84 @@
+// Appends newly added gifts and Telegram animations pushed over /events/catalog.
+(function () {
+  if (!window.EventSource) return;
+
+  var giftList = document.getElementById('gift-cards');
+  var mediaList = document.getElementById('media-cards');
+  if (!giftList || !mediaList) return;
+
+  // Matches the ?w= hint used by the server-rendered cards
+  var CARD_WIDTH = 360;
+
+  function el(tag, attrs, text) {
+    var node = document.createElement(tag);
+    Object.keys(attrs || {}).forEach(function (k) { node.setAttribute(k, attrs[k]); });
+    if (text) node.textContent = text;
+    return node;
+  }
+
+  function video(src) {
+    var v = el('video', { src: src, playsinline: '' });
+    v.autoplay = true; v.loop = true; v.muted = true;
+    return v;
+  }
+
+  function sendForm(hidden) {
+    var form = el('form', { method: 'post', action: '/send', 'class': 'row' });
+    Object.keys(hidden).forEach(function (name) {
+      form.appendChild(el('input', { type: 'hidden', name: name, value: hidden[name] }));
+    });
+    form.appendChild(el('input', { type: 'text', name: 'recipient', placeholder: 'Получатель (chat_id или @username)', required: '' }));
+    form.appendChild(el('input', { type: 'text', name: 'message', placeholder: 'Сообщение (необязательно)' }));
+    form.appendChild(el('button', { type: 'submit' }, 'Отправить'));
+    return form;
+  }
+
+  function prepend(list, key, card) {
+    if (list.querySelector('[data-key="' + key + '"]')) return;
+    var empty = list.querySelector('.empty');
+    if (empty) empty.remove();
+    card.setAttribute('data-key', key);
+    list.insertBefore(card, list.firstChild);
+  }
+
+  function giftCard(g) {
+    var card = el('div', { 'class': 'card' });
+    var media = el('div', { 'class': 'media' });
+    if (g.telegram_file_id) {
+      media.appendChild(video('/media/telegram/' + encodeURIComponent(g.telegram_file_id) + '?w=' + CARD_WIDTH));
+    } else if (g.gif_url) {
+      media.appendChild(/\.mp4$/.test(g.gif_url) ? video(g.gif_url) : el('img', { src: g.gif_url, alt: g.title }));
+    } else {
+      media.appendChild(el('div', { 'class': 'placeholder' }, 'Нет превью'));
+    }
+    var content = el('div', { 'class': 'content' });
+    content.appendChild(el('h3', {}, g.title));
+    if (g.description) content.appendChild(el('p', { 'class': 'muted' }, g.description));
+    content.appendChild(sendForm({ gift_id: g.id }));
+    card.appendChild(media);
+    card.appendChild(content);
+    return card;
+  }
+
+  function mediaCard(m) {
+    var src = '/media/telegram/' + encodeURIComponent(m.file_id);
+    var card = el('div', { 'class': 'card' });
+    var media = el('div', { 'class': 'media' });
+    media.appendChild(m.file_path ? video(src + '?w=' + CARD_WIDTH) : el('div', { 'class': 'placeholder' }, 'Telegram file_id: ' + m.file_id));
+    var content = el('div', { 'class': 'content' });
+    content.appendChild(sendForm({ direct_animation_url: m.file_path ? src : '', direct_file_id: m.file_id }));
+    card.appendChild(media);
+    card.appendChild(content);
+    return card;
+  }
+
+  var source = new EventSource('/events/catalog');
+  source.addEventListener('gift', function (e) {
+    var g = JSON.parse(e.data);
+    prepend(giftList, 'gift-' + g.id, giftCard(g));
+  });
+  source.addEventListener('media', function (e) {
+    var m = JSON.parse(e.data);
+    prepend(mediaList, 'media-' + m.file_id, mediaCard(m));
+  });
+})();
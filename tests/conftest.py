@@ -0,0 +1,35 @@
+import os
+import tempfile
+
+import pytest
+
+# app.database and app.cache read these at import time
+os.environ.setdefault("APP_DATA_DIR", tempfile.mkdtemp(prefix="gifts-test-"))
+os.environ.setdefault("APP_CACHE_URL", "memory://")
+os.environ.setdefault("DISABLE_ADMIN_IP_CHECK", "1")
+
+from app.database import SessionLocal, init_db  # noqa: E402
+
+
+@pytest.fixture(scope="session", autouse=True)
+def _schema():
+    init_db()
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def client():
+    from starlette.testclient import TestClient
+
+    from app.main import app
+
+    with TestClient(app) as test_client:
+        yield test_client
@@ -0,0 +1,70 @@
+import datetime as dt
+
+import pytest
+from sqlalchemy import delete, select
+
+from app.database import Gift, GiftChange
+
+AUTH = ("admin", "admin123")
+OLD = dt.datetime(2020, 1, 1)
+
+
+@pytest.fixture
+def gift_ids(db):
+    db.execute(delete(Gift))
+    gifts = [Gift(title=f"gift {i:02d}", created_at=OLD, updated_at=OLD) for i in range(25)]
+    db.add_all(gifts)
+    db.commit()
+    return [g.id for g in gifts]
+
+
+@pytest.mark.parametrize("query, page, per_page, pages", [
+    ("", 1, 50, 1),
+    ("?per_page=10&page=2", 2, 10, 3),
+    ("?per_page=10&page=99", 3, 10, 3),
+    ("?per_page=0&page=0", 1, 1, 25),
+    ("?per_page=100000", 1, 200, 1),
+])
+def test_admin_list_clamps_paging(client, gift_ids, query, page, per_page, pages):
+    response = client.get(f"/admin/gifts{query}", auth=AUTH)
+    assert response.status_code == 200
+    context = response.context
+    assert (context["page"], context["per_page"], context["pages"], context["total"]) == (page, per_page, pages, 25)
+    assert len(context["gifts"]) == min(per_page, 25 - (page - 1) * per_page)
+
+
+def _seqs(db, ids):
+    return dict(db.execute(select(GiftChange.gift_id, GiftChange.seq).where(GiftChange.gift_id.in_(ids))).all())
+
+
+def test_bulk_update_touches_updated_at_and_change_log(client, db, gift_ids):
+    chosen = gift_ids[:3]
+    before = _seqs(db, gift_ids)
+    response = client.post(
+        "/admin/gifts/bulk-update",
+        data={"ids": [str(i) for i in chosen], "field": "description", "value": " new "},
+        auth=AUTH,
+        follow_redirects=False,
+    )
+    assert response.status_code == 302
+    db.expire_all()
+    rows = {g.id: g for g in db.execute(select(Gift)).scalars()}
+    assert all(rows[i].description == "new" and rows[i].updated_at > OLD for i in chosen)
+    assert all(rows[i].description is None and rows[i].updated_at == OLD for i in gift_ids[3:])
+    after = _seqs(db, gift_ids)
+    assert all(after[i] > max(before.values()) for i in chosen)
+    assert all(after[i] == before[i] for i in gift_ids[3:])
+
+
+def test_bulk_update_rejects_other_fields(client, gift_ids):
+    response = client.post("/admin/gifts/bulk-update", data={"ids": [str(gift_ids[0])], "field": "id", "value": "1"}, auth=AUTH)
+    assert response.status_code == 400
+
+
+def test_bulk_delete_removes_gifts_and_logs_deletions(client, db, gift_ids):
+    chosen = gift_ids[:2]
+    response = client.post("/admin/gifts/bulk-delete", data={"ids": [str(i) for i in chosen]}, auth=AUTH, follow_redirects=False)
+    assert response.status_code == 302
+    assert set(db.execute(select(Gift.id)).scalars()) == set(gift_ids[2:])
+    deleted = dict(db.execute(select(GiftChange.gift_id, GiftChange.deleted).where(GiftChange.gift_id.in_(chosen))).all())
+    assert deleted == {i: 1 for i in chosen}
@@ -0,0 +1,128 @@
+import asyncio
+
+from app.admission import AdmissionController, AdmissionMiddleware
+
+
+def _scope(path="/api/gifts"):
+    return {"type": "http", "method": "GET", "path": path, "headers": [], "query_string": b""}
+
+
+async def _call(app, path="/api/gifts"):
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    await app(_scope(path), receive, send)
+    return messages
+
+
+def _status(messages):
+    return messages[0]["status"]
+
+
+def _headers(messages):
+    return {k.decode(): v.decode() for k, v in messages[0]["headers"]}
+
+
+class HeldApp:
+    """Streams one chunk, then holds the response open until released."""
+
+    def __init__(self):
+        self.started = asyncio.Event()
+        self.release = asyncio.Event()
+
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"first", "more_body": True})
+        self.started.set()
+        await self.release.wait()
+        await send({"type": "http.response.body", "body": b"last", "more_body": False})
+
+
+def _middleware(limit, queue, wait):
+    controller = AdmissionController({"db": (limit, queue, wait)})
+    app = HeldApp()
+    return AdmissionMiddleware(app, controller), app, controller.classes["db"]
+
+
+def test_queue_full_is_rejected_with_503():
+    async def scenario():
+        middleware, app, route_class = _middleware(limit=1, queue=0, wait=1.0)
+        first = asyncio.create_task(_call(middleware))
+        await app.started.wait()
+
+        rejected = await _call(middleware)
+        assert _status(rejected) == 503
+        assert _headers(rejected)["x-admission-class"] == "db"
+        assert _headers(rejected)["retry-after"] == "1"
+        assert route_class.rejected == {"queue_full": 1, "timeout": 0}
+
+        app.release.set()
+        assert _status(await first) == 200
+        return route_class
+
+    route_class = asyncio.run(scenario())
+    assert (route_class.active, route_class.waiting, route_class.admitted) == (0, 0, 1)
+
+
+def test_queued_request_times_out():
+    async def scenario():
+        middleware, app, route_class = _middleware(limit=1, queue=1, wait=0.05)
+        first = asyncio.create_task(_call(middleware))
+        await app.started.wait()
+
+        rejected = await _call(middleware)
+        assert _status(rejected) == 503
+        assert _headers(rejected)["retry-after"] == "1"
+        assert route_class.rejected == {"queue_full": 0, "timeout": 1}
+        assert route_class.waiting == 0
+
+        app.release.set()
+        await first
+        return route_class
+
+    route_class = asyncio.run(scenario())
+    assert route_class.active == 0
+
+
+def test_slot_is_held_until_the_stream_ends_then_handed_to_the_queue():
+    async def scenario():
+        middleware, app, route_class = _middleware(limit=1, queue=1, wait=5.0)
+        first = asyncio.create_task(_call(middleware))
+        await app.started.wait()
+        assert route_class.active == 1
+
+        second = asyncio.create_task(_call(middleware))
+        await asyncio.sleep(0.01)
+        assert route_class.waiting == 1
+
+        app.release.set()
+        messages = await first
+        assert [m.get("body") for m in messages[1:]] == [b"first", b"last"]
+        assert _status(await second) == 200
+        return route_class
+
+    route_class = asyncio.run(scenario())
+    assert (route_class.active, route_class.waiting, route_class.admitted) == (0, 0, 2)
+    assert route_class.rejected == {"queue_full": 0, "timeout": 0}
+
+
+def test_exempt_paths_bypass_the_limit():
+    async def scenario():
+        middleware, app, route_class = _middleware(limit=1, queue=0, wait=1.0)
+        first = asyncio.create_task(_call(middleware))
+        await app.started.wait()
+        # The only slot is taken and nothing may queue, yet this gets through
+        exempt = asyncio.create_task(_call(middleware, "/static/app.css"))
+        await asyncio.sleep(0.01)
+        app.release.set()
+        await first
+        return await exempt, route_class
+
+    exempt, route_class = asyncio.run(scenario())
+    assert _status(exempt) == 200
+    assert route_class.admitted == 1
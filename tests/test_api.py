@@ -0,0 +1,30 @@
+import pytest
+from sqlalchemy import delete
+
+from app import main
+from app.database import Gift, TelegramMedia
+
+
+@pytest.fixture(autouse=True)
+def _media(db):
+    db.execute(delete(Gift))
+    db.execute(delete(TelegramMedia))
+    db.add(TelegramMedia(file_id="F/1", file_unique_id="U1", file_path="animations/file_1.mp4", caption="dancing cat"))
+    db.commit()
+
+
+@pytest.mark.parametrize("path", ["/api/telegram/animations", "/api/telegram/animations/changes", "/api/search?q=cat"])
+def test_media_urls_do_not_carry_the_bot_token(client, path):
+    response = client.get(path)
+    assert response.status_code == 200
+    assert "api.telegram.org" not in response.text
+    assert "/media/telegram/F%2F1" in response.text
+
+
+def test_media_events_do_not_carry_the_bot_token(db, monkeypatch):
+    published = []
+    monkeypatch.setattr(main.broadcaster, "publish", lambda event, data: published.append((event, data)))
+    monkeypatch.setattr("app.ingest.drain", lambda workers, on_media: on_media(db.query(TelegramMedia).one()))
+    main._drain_journal()
+    assert published == [("media", main._media_dict(db.query(TelegramMedia).one()))]
+    assert published[0][1]["url"] == "/media/telegram/F%2F1"
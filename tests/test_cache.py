@@ -0,0 +1,61 @@
+import pytest
+
+from app import cache
+from app.cache import MemoryCache, SharedCache, SQLiteCache
+
+
+class DownCache(MemoryCache):
+    def __init__(self, failing=("get", "set", "delete", "add", "incr")):
+        super().__init__()
+        self.failing = set(failing)
+
+    def __getattribute__(self, name):
+        if name in object.__getattribute__(self, "failing"):
+            raise ConnectionError("backend down")
+        return object.__getattribute__(self, name)
+
+
+@pytest.fixture
+def use_backend(monkeypatch):
+    def use(backend):
+        monkeypatch.setattr(cache, "_cache", SharedCache(backend))
+        return backend
+    monkeypatch.setattr(cache, "_bump_lost", cache.threading.Event())
+    return use
+
+
+def test_version_changes_when_backend_loses_its_data(use_backend):
+    use_backend(MemoryCache())
+    before, _ = cache.catalog_state()
+    use_backend(MemoryCache())  # e.g. a restart of a memory:// worker
+    after, _ = cache.catalog_state()
+    assert before.endswith(".0") and after.endswith(".0")
+    assert before != after
+
+
+def test_lost_bump_starts_a_new_epoch(use_backend):
+    backend = use_backend(DownCache(failing=()))
+    before, _ = cache.catalog_state()
+
+    backend.failing = {"incr", "delete"}
+    assert cache.bump_catalog_version() is None
+    backend.failing = set()
+
+    after, _ = cache.catalog_state()
+    assert after != before
+
+
+def test_no_version_while_backend_is_down(use_backend):
+    use_backend(DownCache())
+    assert cache.catalog_state() is None
+    assert cache.catalog_version() is None
+
+
+def test_sqlite_add_only_sets_missing_keys(tmp_path):
+    backend = SQLiteCache(str(tmp_path / "cache.db"))
+    assert backend.add("k", "a")
+    assert not backend.add("k", "b")
+    assert backend.get("k") == b"a"
+    backend.set("t", "old", ttl=-1)
+    assert backend.add("t", "new")
+    assert backend.get("t") == b"new"
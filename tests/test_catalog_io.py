@@ -0,0 +1,40 @@
+import io
+
+import pytest
+from sqlalchemy import delete, select
+
+from app.catalog_io import import_gifts
+from app.database import Gift
+
+
+@pytest.fixture(autouse=True)
+def _empty_catalog(db):
+    db.execute(delete(Gift))
+    db.commit()
+
+
+def _titles(db):
+    return sorted(db.execute(select(Gift.title)).scalars())
+
+
+def test_invalid_utf8_line_is_reported(db):
+    data = '{"title": "один"}\n'.encode() + b'{"title": "\xff\xfe"}\n' + '{"title": "три"}\n'.encode()
+    report = import_gifts(db, io.BytesIO(data), "ndjson")
+    assert (report.inserted, report.skipped) == (2, 1)
+    assert report.errors == [{"line": 2, "error": "Invalid UTF-8"}]
+    assert _titles(db) == ["один", "три"]
+
+
+def test_invalid_utf8_in_multiline_csv_record(db):
+    data = b'\xef\xbb\xbftitle,description\nok,fine\nbad,"two\n\xff lines"\nlast,\n'
+    report = import_gifts(db, io.BytesIO(data), "csv")
+    assert (report.inserted, report.skipped) == (2, 1)
+    assert report.errors == [{"line": 4, "error": "Invalid UTF-8"}]
+    assert _titles(db) == ["last", "ok"]
+
+
+def test_duplicate_keys_in_one_batch_add_up(db):
+    data = b'{"title": "first", "telegram_file_id": "F"}\n{"title": "second", "telegram_file_id": "F"}\n'
+    report = import_gifts(db, io.BytesIO(data), "ndjson")
+    assert (report.inserted, report.updated, report.skipped) == (1, 1, 0)
+    assert _titles(db) == ["second"]
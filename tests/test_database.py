@@ -0,0 +1,30 @@
+import time
+
+from sqlalchemy import delete, select
+
+from app.database import SessionLocal, engine, Gift
+
+
+def test_wal_is_enabled():
+    with engine.connect() as conn:
+        assert conn.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+
+
+def test_open_streaming_cursor_does_not_block_writers(db):
+    db.execute(delete(Gift))
+    db.add_all([Gift(title=f"g{i}") for i in range(50)])
+    db.commit()
+
+    reader = SessionLocal()
+    try:
+        # Like the streamed index page: a partly consumed yield_per cursor
+        rows = reader.execute(select(Gift).execution_options(yield_per=10)).scalars()
+        next(rows)
+
+        started = time.monotonic()
+        db.add(Gift(title="while streaming"))
+        db.commit()
+        assert time.monotonic() - started < 1
+        assert len(list(rows)) == 49
+    finally:
+        reader.close()
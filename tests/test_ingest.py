@@ -0,0 +1,51 @@
+import json
+
+import pytest
+from sqlalchemy import delete
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+from app import ingest
+from app.database import TelegramMedia, TelegramUpdate
+
+
+class FakeClient:
+    def get_file(self, file_id):
+        return {"ok": True, "result": {"file_path": f"anim/{file_id}.mp4"}}
+
+
+PAYLOAD = json.dumps({"update_id": 1, "message": {"animation": {"file_id": "F1", "file_unique_id": "U1"}}})
+
+
+@pytest.fixture(autouse=True)
+def _journal(db, monkeypatch):
+    db.execute(delete(TelegramUpdate))
+    db.execute(delete(TelegramMedia))
+    db.commit()
+    monkeypatch.setattr(ingest, "CLAIM_BACKOFF", 0)
+    monkeypatch.setattr(ingest, "TelegramClient", FakeClient)
+
+
+def test_claim_is_retried_when_the_database_is_locked(db, monkeypatch):
+    ingest.journal(db, [json.loads(PAYLOAD)])
+    claim = ingest.claim
+    calls = []
+
+    def flaky_claim(session, *args):
+        calls.append(1)
+        if len(calls) <= 2:
+            raise OperationalError("UPDATE telegram_updates", {}, Exception("database is locked"))
+        return claim(session, *args)
+
+    monkeypatch.setattr(ingest, "claim", flaky_claim)
+    stats = ingest.drain(workers=1)
+    assert stats["processed"] == 1 and stats["claim_failed"] == 0
+    assert db.query(TelegramMedia).count() == 1
+
+
+def test_persistent_conflicts_end_in_a_retryable_error(db, monkeypatch):
+    def commit():
+        raise IntegrityError("INSERT INTO telegram_media", {}, Exception("UNIQUE constraint failed"))
+
+    monkeypatch.setattr(db, "commit", commit)
+    with pytest.raises(ingest.IngestError):
+        ingest.process(db, FakeClient(), 1, PAYLOAD)
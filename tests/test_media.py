@@ -0,0 +1,77 @@
+import pytest
+import requests
+
+from app.media import MediaError, resolve_file_path
+
+
+class FakeClient:
+    def __init__(self, error):
+        self.error = error
+
+    def get_file(self, file_id):
+        raise self.error
+
+
+def _http_error(status):
+    resp = requests.Response()
+    resp.status_code = status
+    return requests.HTTPError(f"{status} Client Error", response=resp)
+
+
+@pytest.mark.parametrize("error, status", [
+    (_http_error(400), 404),
+    (_http_error(500), 502),
+    (requests.ConnectionError("refused"), 502),
+    (requests.Timeout("slow"), 502),
+])
+def test_get_file_errors_map_to_media_errors(error, status):
+    with pytest.raises(MediaError) as exc:
+        resolve_file_path(FakeClient(error), "F1")
+    assert exc.value.status_code == status
+
+
+class FakeUpstream:
+    def __init__(self):
+        self.headers = {"Content-Type": "video/mp4", "Content-Length": "1000"}
+        self.closed = False
+        self.read = False
+
+    def iter_content(self, chunk_size):
+        self.read = True
+        yield b"x" * 1000
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    fake = FakeUpstream()
+    monkeypatch.setattr("app.main.open_upstream", lambda *args: fake)
+    monkeypatch.setattr("app.media_edge.open_upstream", lambda *args: fake)
+    return fake
+
+
+def test_head_does_not_download_the_body(client, upstream):
+    response = client.head("/media/telegram/F1")
+    assert response.status_code == 200
+    assert response.headers["content-length"] == "1000"
+    assert response.headers["content-type"] == "video/mp4"
+    assert upstream.closed and not upstream.read
+
+
+def test_edge_head_does_not_download_the_body(upstream):
+    from starlette.testclient import TestClient
+
+    from app.media_edge import app
+
+    response = TestClient(app).head("/media/telegram/F1")
+    assert response.status_code == 200
+    assert response.headers["content-length"] == "1000"
+    assert upstream.closed and not upstream.read
+
+
+def test_get_streams_the_body(client, upstream):
+    response = client.get("/media/telegram/F1")
+    assert response.content == b"x" * 1000
+    assert upstream.read
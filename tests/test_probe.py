@@ -0,0 +1,28 @@
+import pytest
+from sqlalchemy import delete
+
+from app import cache
+from app.database import MediaMetadata, TelegramMedia
+from app.probe import store
+
+RESULT = {"mime_type": "video/mp4", "bytes": 100, "width": 320, "height": 240, "duration": 1.0, "sha256": "0" * 64}
+
+
+@pytest.fixture(autouse=True)
+def _media(db):
+    db.execute(delete(TelegramMedia))
+    db.execute(delete(MediaMetadata))
+    db.add(TelegramMedia(file_id="F1", file_unique_id="U1", mime_type="video/mp4"))
+    db.commit()
+
+
+def test_store_fills_gaps_once(db):
+    versions = [cache.catalog_version()]
+    for _ in range(3):
+        store(db, "U1", dict(RESULT))
+        versions.append(cache.catalog_version())
+    assert versions[0] != versions[1]
+    assert versions[1] == versions[2] == versions[3]
+
+    media = db.execute(TelegramMedia.__table__.select()).one()
+    assert (media.size, media.width, media.height) == (100, 320, 240)
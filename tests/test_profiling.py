@@ -0,0 +1,22 @@
+import pytest
+
+from app.profiling import _requested
+
+
+def _scope(query=b"", headers=()):
+    return {"type": "http", "query_string": query, "headers": list(headers)}
+
+
+@pytest.mark.parametrize("scope, expected", [
+    (_scope(b"_profile=1"), True),
+    (_scope(b"q=cat&_profile=1"), True),
+    (_scope(headers=[(b"x-profile", b"1")]), True),
+    (_scope(), False),
+    (_scope(b"x_profile=10"), False),
+    (_scope(b"_profile=10"), False),
+    (_scope(b"_profile=0"), False),
+    (_scope(headers=[(b"x-profile", b"0")]), False),
+    (_scope(headers=[(b"x-profiler", b"1")]), False),
+])
+def test_profiling_flag(scope, expected):
+    assert _requested(scope) is expected
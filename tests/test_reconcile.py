@@ -0,0 +1,60 @@
+import os
+
+import pytest
+from sqlalchemy import delete
+
+from app import reconcile
+from app.database import RENDITIONS_DIR, MediaMetadata, MediaRendition, TelegramMedia
+
+
+@pytest.fixture(autouse=True)
+def _tables(db, monkeypatch):
+    for model in (TelegramMedia, MediaRendition, MediaMetadata):
+        db.execute(delete(model))
+    db.commit()
+    monkeypatch.setattr(reconcile, "PAUSE", 0)
+
+
+def _rendition_file(name):
+    path = os.path.join(RENDITIONS_DIR, "small", name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"x")
+    return os.path.join("small", name)
+
+
+def _ingest_between_select_and_delete(db, monkeypatch, file_unique_id):
+    """Insert a telegram_media row right after reconcile's select of each batch."""
+    batches = reconcile._batches
+
+    def racing_batches(*args):
+        for rows in batches(*args):
+            db.add(TelegramMedia(file_id=f"new-{file_unique_id}", file_unique_id=file_unique_id))
+            db.commit()
+            yield rows
+
+    monkeypatch.setattr(reconcile, "_batches", racing_batches)
+
+
+@pytest.mark.parametrize("evict, nothing", [(reconcile.evict_renditions, {"rows": 0, "files": 0, "bytes": 0}), (reconcile.evict_metadata, 0)])
+def test_evict_skips_media_ingested_after_the_select(db, monkeypatch, evict, nothing):
+    rel_path = _rendition_file("U1.mp4")
+    db.add(MediaRendition(file_unique_id="U1", label="small", path=rel_path))
+    db.add(MediaMetadata(file_unique_id="U1"))
+    db.commit()
+    _ingest_between_select_and_delete(db, monkeypatch, "U1")
+
+    assert evict(db) == nothing
+    assert db.query(MediaRendition).count() == 1 and db.query(MediaMetadata).count() == 1
+    assert os.path.exists(os.path.join(RENDITIONS_DIR, rel_path))
+
+
+def test_evict_removes_unused_renditions_and_files(db):
+    rel_path = _rendition_file("U2.mp4")
+    db.add(MediaRendition(file_unique_id="U2", label="small", path=rel_path))
+    db.add(MediaMetadata(file_unique_id="U2"))
+    db.commit()
+
+    assert reconcile.evict_renditions(db) == {"rows": 1, "files": 1, "bytes": 1}
+    assert reconcile.evict_metadata(db) == 1
+    assert not os.path.exists(os.path.join(RENDITIONS_DIR, rel_path))
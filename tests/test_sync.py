@@ -0,0 +1,107 @@
+import datetime as dt
+
+import pytest
+from sqlalchemy import delete, update
+
+from app import reconcile
+from app.database import Gift, TelegramMedia
+from app.sync import CursorError, gift_changes, media_changes, parse_cursor
+
+
+@pytest.fixture(autouse=True)
+def _empty_catalog(db):
+    db.execute(delete(Gift))
+    db.execute(delete(TelegramMedia))
+    db.commit()
+
+
+def _sync(db, cursor=0, limit=1, catalog=None):
+    """Replay pages the way a client does: deletions first, then updates."""
+    catalog = {} if catalog is None else catalog
+    while True:
+        delta = gift_changes(db, cursor, limit=limit)
+        for gift_id in delta.deleted:
+            catalog.pop(gift_id, None)
+        for gift in delta.updated:
+            catalog[gift.id] = gift.title
+        cursor = delta.cursor
+        if not delta.has_more:
+            return catalog, cursor
+
+
+def _add(db, *titles):
+    gifts = [Gift(title=title) for title in titles]
+    db.add_all(gifts)
+    db.commit()
+    return [g.id for g in gifts]
+
+
+def test_reused_gift_id_is_not_deleted_by_its_old_tombstone(db):
+    ids = _add(db, "one", "two", "three", "four", "five")
+    db.execute(delete(Gift).where(Gift.id.in_([ids[0], ids[1], ids[2], ids[4]])))
+    db.commit()
+    (reborn,) = _add(db, "reborn")
+    assert reborn == ids[4]  # gifts has no AUTOINCREMENT, the id is reused
+
+    catalog, _ = _sync(db, limit=1)
+    assert catalog == {ids[3]: "four", reborn: "reborn"}
+
+
+def test_late_commit_with_older_updated_at_is_not_skipped(db):
+    first, second = _add(db, "first", "second")
+    catalog, cursor = _sync(db)
+
+    # A writer that stamped updated_at before the cursor was handed out but
+    # committed after it
+    gift = db.get(Gift, first)
+    gift.title = "first, edited"
+    gift.updated_at = dt.datetime(2000, 1, 1)
+    db.commit()
+
+    catalog, _ = _sync(db, cursor, catalog=catalog)
+    assert catalog == {first: "first, edited", second: "second"}
+
+
+def test_deletion_after_cursor(db):
+    first, second = _add(db, "first", "second")
+    catalog, cursor = _sync(db, limit=10)
+    db.execute(delete(Gift).where(Gift.id == first))
+    db.commit()
+
+    delta = gift_changes(db, cursor)
+    assert delta.deleted == [first] and delta.updated == []
+    assert gift_changes(db, delta.cursor).cursor == delta.cursor
+
+
+def test_media_pruning_and_path_changes_are_synced(db, monkeypatch):
+    old = TelegramMedia(file_id="F1", file_unique_id="U1", file_path="a.mp4")
+    new = TelegramMedia(file_id="F2", file_unique_id="U1", file_path="b.mp4")
+    db.add_all([old, new])
+    db.commit()
+    cursor = media_changes(db, 0).cursor
+
+    monkeypatch.setattr(reconcile, "PAUSE", 0)
+    assert reconcile.prune_duplicate_media(db) == 1
+    db.execute(update(TelegramMedia).where(TelegramMedia.id == new.id).values(file_path="c.mp4"))
+    db.commit()
+
+    delta = media_changes(db, cursor)
+    assert delta.deleted == [old.id]
+    assert [(m.id, m.file_path) for m in delta.updated] == [(new.id, "c.mp4")]
+
+
+def test_media_bookkeeping_is_not_a_change(db):
+    media = TelegramMedia(file_id="F1", file_path="a.mp4")
+    db.add(media)
+    db.commit()
+    cursor = media_changes(db, 0).cursor
+
+    db.execute(update(TelegramMedia).values(file_path_checked_at=dt.datetime.utcnow()))
+    db.commit()
+    assert media_changes(db, cursor).cursor == cursor
+
+
+@pytest.mark.parametrize("raw", ["1.2.3", "abc", "-1"])
+def test_malformed_cursor(raw):
+    with pytest.raises(CursorError):
+        parse_cursor(raw)
@@ -0,0 +1,36 @@
+import pytest
+from sqlalchemy import delete
+
+from app.database import MediaRendition, TelegramMedia
+from app.transcode import pending_media, store_results
+
+PROFILES = {"small": 360, "medium": 720}
+
+
+@pytest.fixture(autouse=True)
+def _media(db):
+    db.execute(delete(TelegramMedia))
+    db.execute(delete(MediaRendition))
+    db.add(TelegramMedia(file_id="F1", file_unique_id="U1"))
+    db.commit()
+
+
+def test_failures_are_not_stored_and_retried(db):
+    store_results(db, "U1", [
+        {"label": "small", "path": None, "error": "source: 502 Bad Gateway"},
+        {"label": "medium", "path": None, "error": "timed out"},
+    ])
+    assert db.query(MediaRendition).count() == 0
+    assert pending_media(db, 10, PROFILES) == [("F1", "U1", PROFILES)]
+
+
+def test_only_labels_without_an_outcome_are_pending(db):
+    store_results(db, "U1", [
+        {"label": "small", "path": None, "error": "source is already small enough", "final": True},
+        {"label": "medium", "path": None, "error": "Command '...' timed out"},
+    ])
+    assert pending_media(db, 10, PROFILES) == [("F1", "U1", {"medium": 720})]
+
+    store_results(db, "U1", [{"label": "medium", "path": "medium/U1.mp4", "bytes": 10, "final": True}])
+    assert pending_media(db, 10, PROFILES) == []
+    assert {r.label: r.path for r in db.query(MediaRendition)} == {"small": None, "medium": "medium/U1.mp4"}